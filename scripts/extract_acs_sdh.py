@@ -1,23 +1,51 @@
-# Debug: Print selected ACS columns and friendly names
-print("Selected ACS columns for SDoH factors:")
-for code, name in factor_codes.items():
-    print(f"{code}: {name}")
-import pandas as pd
-
+import numpy as np
 import pandas as pd
 import os
 import sys
 import traceback
 
+try:
+    from numba import njit, prange
+except ImportError:  # numba is optional; the NumPy path below is used without it
+    njit = None
+
+if njit is not None:
+    @njit(parallel=True, cache=True)
+    def outlier_flags(values, direction_high, out):
+        """Writes 1 into `out` where a value is more than one sample std past the column mean
+        in its bad direction. Mean/std use a single Welford pass that skips NaNs."""
+        n_rows, n_cols = values.shape
+        for j in prange(n_cols):
+            count = 0
+            mean = 0.0
+            m2 = 0.0
+            for i in range(n_rows):
+                x = values[i, j]
+                if not np.isnan(x):
+                    count += 1
+                    delta = x - mean
+                    mean += delta / count
+                    m2 += delta * (x - mean)
+            if count < 2:
+                continue
+            std = np.sqrt(m2 / (count - 1))
+            for i in range(n_rows):
+                x = values[i, j]
+                if direction_high[j]:
+                    out[i, j] = 1 if x > mean + std else 0
+                else:
+                    out[i, j] = 1 if x < mean - std else 0
+
 # Paths
 
 acs_data_path = '/Users/ananth/Personal AI Projects/Risk Grouper - Development/Public Files/ACSST5Y2023.S1701_2025-08-23T191746/ACSST5Y2023.S1701-Data.csv'
 metadata_path = '/Users/ananth/Personal AI Projects/Risk Grouper - Development/Public Files/ACSST5Y2023.S1701_2025-08-23T191746/ACSST5Y2023.S1701-Column-Metadata.csv'
-output_path = 'output/sdoh_factors.csv'
+output_path = 'output/sdoh_factors.parquet'
 
-# Read ACS data and metadata
-acs_df = pd.read_csv(acs_data_path, low_memory=False)
+# Read the metadata and only the header of the ACS data; the data itself is read
+# once the SDoH columns are known (see Step 2).
 metadata_df = pd.read_csv(metadata_path)
+acs_columns = pd.read_csv(acs_data_path, nrows=0).columns
 
 # Define key SDoH indicators most likely to impact healthcare
 indicator_keywords = [
@@ -36,75 +64,85 @@ indicator_keywords = [
 
 
 # Step 1: Select SDoH columns and create user-friendly names
+# Stringify and lower-case each metadata row once so every keyword is a single
+# vectorized substring scan. The unit separator keeps matches inside one cell.
+metadata_text = metadata_df.astype(str).agg('\x1f'.join, axis=1).str.lower()
 factor_info = []
 for keyword in indicator_keywords:
-    matches = metadata_df[metadata_df.apply(lambda row: row.astype(str).str.contains(keyword, case=False, na=False).any(), axis=1)]
+    matches = metadata_df[metadata_text.str.contains(keyword.lower(), regex=False)]
     for _, row in matches.iterrows():
         col_code = row['Column Code'] if 'Column Code' in row else row.get('Column Code', None)
         col_label = row['Label'] if 'Label' in row else row.get('Label', None)
-        if col_code and col_code in acs_df.columns:
+        if col_code and col_code in acs_columns:
             friendly_name = col_label if col_label else keyword.title()
             factor_info.append({'code': col_code, 'name': friendly_name, 'keyword': keyword})
 
 # Always include geography column
-geo_col = 'NAME' if 'NAME' in acs_df.columns else None
+geo_col = 'NAME' if 'NAME' in acs_columns else None
 
 # Step 2: Build dataframe and calculate outlier flags
 factor_codes = [f['code'] for f in factor_info]
 factor_names = [f['name'] for f in factor_info]
 factor_keywords = [f['keyword'] for f in factor_info]
 
+# Debug: Print selected ACS columns and friendly names
+print("Selected ACS columns for SDoH factors:")
+for code, name in zip(factor_codes, factor_names):
+    print(f"{code}: {name}")
+
+# Only parse the geography and selected factor columns (the full table has hundreds).
+usecols = list(dict.fromkeys(([geo_col] if geo_col else []) + factor_codes))
+acs_df = pd.read_csv(acs_data_path, engine='pyarrow', usecols=usecols)
+
 factor_data = acs_df[factor_codes].apply(pd.to_numeric, errors='coerce')
-means = factor_data.mean()
-stds = factor_data.std()
 
-# Define which direction is 'bad' for each factor
-bad_direction = {}
+# Define which direction is 'bad' for each factor: True when high values are bad,
+# False when low values are bad. Keyed by column code, so a column matched by
+# several keywords takes the direction of the last one.
+high_is_bad = {}
 for f in factor_info:
     if any(k in f['keyword'] for k in ['poverty', 'snap', 'food stamp', 'unemploy']):
-        bad_direction[f['code']] = 'high'
+        high_is_bad[f['code']] = True
     elif 'education' in f['keyword']:
-        bad_direction[f['code']] = 'low'
+        high_is_bad[f['code']] = False
     elif any(k in f['keyword'] for k in ['insurance', 'health', 'income']):
-        bad_direction[f['code']] = 'low'
+        high_is_bad[f['code']] = False
     else:
-        bad_direction[f['code']] = 'high'
+        high_is_bad[f['code']] = True
+# Aligned with factor_codes so the flag computation below is a pure array operation.
+direction_high = np.fromiter((high_is_bad[code] for code in factor_codes), dtype=bool, count=len(factor_codes))
+
+# Flag outliers for every (geography, factor) pair in a single vectorized pass.
+# Missing values compare False on both sides, so they are never flagged.
+values = factor_data.to_numpy(dtype=np.float64)
+# One contiguous int8 (geography x factor) buffer, filled in place by either path.
+flags = np.zeros(values.shape, dtype=np.int8)
+if njit is not None:
+    outlier_flags(values, direction_high, flags)
+else:
+    mean_arr = np.nanmean(values, axis=0)
+    std_arr = np.nanstd(values, axis=0, ddof=1)
+    # Each comparison writes only its own direction's columns, straight into the buffer.
+    np.greater(values, mean_arr + std_arr, out=flags, where=direction_high, casting='unsafe')
+    np.less(values, mean_arr - std_arr, out=flags, where=~direction_high, casting='unsafe')
 
-output_rows = []
 geo_values = acs_df[geo_col] if geo_col else acs_df.index.astype(str)
-for idx, geo in enumerate(geo_values):
-    row = {'Geography': geo}
-    for code, name, keyword in zip(factor_codes, factor_names, factor_keywords):
-        value = factor_data.iloc[idx][code]
-        mean = means[code]
-        std = stds[code]
-        flag = 0
-        if pd.notnull(value):
-            if bad_direction[code] == 'high':
-                if value > mean + std:
-                    flag = 1
-            elif bad_direction[code] == 'low':
-                if value < mean - std:
-                    flag = 1
-        row[name + ' Outlier'] = flag
-    output_rows.append(row)
-
-output_df = pd.DataFrame(output_rows)
-os.makedirs(os.path.dirname(output_path), exist_ok=True)
-try:
-    output_df.to_csv(output_path, index=False)
-except Exception as e:
-    with open('output/sdoh_error.log', 'w') as log:
-        log.write(traceback.format_exc())
-    print(f"Error occurred. See output/sdoh_error.log for details.", file=sys.stderr)
-
-
-
-# ...existing code...
-os.makedirs(os.path.dirname(output_path), exist_ok=True)
-try:
-    output_df.to_csv(output_path, index=False)
-except Exception as e:
-    with open('output/sdoh_error.log', 'w') as log:
-        log.write(traceback.format_exc())
-    print(f"Error occurred. See output/sdoh_error.log for details.", file=sys.stderr)
+flag_columns = pd.Index([name + ' Outlier' for name in factor_names])
+# A column can be matched by several keywords; keep one flag column per friendly name.
+keep = ~flag_columns.duplicated()
+if not keep.all():
+    flags = flags[:, keep]
+output_df = pd.DataFrame(flags, columns=flag_columns[keep], copy=False)
+output_df.insert(0, 'Geography', np.asarray(geo_values))
+if output_df.empty:
+    # Nothing to flag (e.g. no rows in the ACS extract); don't write an empty file.
+    print("No geographies to write; skipping output.", file=sys.stderr)
+else:
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    try:
+        # Typed, compressed columnar output; the flags stay int8 on disk.
+        output_df.to_parquet(output_path, index=False, compression='zstd')
+    except Exception as e:
+        with open('output/sdoh_error.log', 'w') as log:
+            log.write(traceback.format_exc())
+        print(f"Error occurred. See output/sdoh_error.log for details.", file=sys.stderr)
@@ -12,25 +12,27 @@ The pipeline includes:
 2.  **Data Preparation**: Splits the data into training and validation sets based on a
     predefined column, handles missing values in the target variable, and separates
     features from non-feature columns.
-3.  **Baseline Modeling**: Trains a Logistic Regression model as a baseline for performance
-    comparison.
+3.  **Baseline Modeling**: Trains a Logistic Regression model on a bounded sample of the
+    training set as a baseline for performance comparison (skip with `--skip-baseline`).
 4.  **Advanced Modeling (XGBoost)**:
     - Handles class imbalance using `scale_pos_weight`.
-    - Performs hyperparameter tuning using `GridSearchCV` to find the best model
-      parameters for `n_estimators`, `max_depth`, and `learning_rate`.
-    - Trains a final XGBoost model with the best parameters.
+    - Performs hyperparameter tuning over a random sample of `n_estimators`,
+      `max_depth`, and `learning_rate` values, scored by cross-validated AUC on
+      folds quantized once into `QuantileDMatrix` objects.
+    - Trains a final XGBoost booster with the best parameters.
 5.  **Evaluation**: Evaluates the XGBoost model on the validation set, calculating
     accuracy, AUC score, confusion matrix, and a detailed classification report.
 6.  **Output Generation**: Saves multiple artifacts for each run, including:
-    - Model predictions on the validation set.
+    - Model predictions on the validation set (Parquet).
     - Feature importances.
     - A SHAP summary plot for model interpretability.
     - A list of the top individuals most at risk.
     - A text file summarizing the key performance metrics.
 7.  **Logging and Auditing**:
     - Creates a detailed, timestamped log file for each analysis run.
-    - Appends a one-line summary of each run to a master CSV log (`run_summary_log.csv`),
-      tracking key parameters and results for audit and review.
+    - Appends a one-line summary of each target to a master Parquet log
+      (`run_summary_log.parquet`, partitioned by analysis type), tracking key
+      parameters and results for audit and review.
 
 The script is designed to be run iteratively for different prediction windows (30, 60, 90 days)
 and event types (ED, IP, Any), making it a powerful tool for comprehensive risk analysis.
@@ -38,17 +40,37 @@ and event types (ED, IP, Any), making it a powerful tool for comprehensive risk
 Usage:
     Run the script from the command line and follow the interactive prompts:
     $ python src/RiskGrouper.py
+
+    The fetched dataset is cached locally as Parquet; pass `--refresh-cache` to
+    re-query Snowflake regardless:
+    $ python src/RiskGrouper.py --refresh-cache
 """
+import numpy as np
 import pandas as pd
-from xgboost import XGBClassifier
+import xgboost as xgb
 from sklearn.metrics import classification_report, confusion_matrix, roc_auc_score, accuracy_score
 from sklearn.linear_model import LogisticRegression
-from sklearn.model_selection import GridSearchCV
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+from sklearn.model_selection import ParameterSampler, StratifiedKFold
+from scipy.stats import randint, loguniform
 import os
+import argparse
+import hashlib
+import shutil
+import tempfile
 import shap
+import matplotlib
+matplotlib.use('Agg')  # Plots are only written to disk; no GUI backend needed
+import matplotlib.pyplot as plt
 from snowflake_connector import SnowflakeConnector
+from caching import is_cache_valid, load_from_cache, save_to_cache
 import logging
+import gc
 from datetime import datetime
+from joblib import Parallel, delayed
+import pyarrow as pa
+import pyarrow.parquet as pq
 
 # Define the directory for storing log files.
 # This helps in organizing and retaining historical run data.
@@ -58,7 +80,61 @@ if not os.path.exists(LOG_DIR):
 
 # Define the master log file for summarizing all runs.
 # This provides a high-level audit trail of all analyses performed.
-log_summary_file = os.path.join(LOG_DIR, 'run_summary_log.csv')
+# It is a Parquet dataset partitioned by analysis type; every run adds one file to it.
+log_summary_file = os.path.join(LOG_DIR, 'run_summary_log.parquet')
+
+# A fixed schema keeps every file of the master log readable as one dataset, even when
+# a run fails before some of the metrics are known.
+RUN_SUMMARY_SCHEMA = pa.schema([
+    ('run_timestamp', pa.string()), ('analysis_type', pa.string()), ('log_file', pa.string()),
+    ('status', pa.string()), ('target_variable', pa.string()), ('initial_rows', pa.int64()),
+    ('training_rows_after_cleaning', pa.int64()), ('validation_rows_after_cleaning', pa.int64()),
+    ('feature_count', pa.int64()), ('lr_accuracy', pa.float64()), ('xgb_best_params', pa.string()),
+    ('xgb_accuracy', pa.float64()), ('xgb_auc', pa.float64()), ('predictions_file', pa.string()),
+    ('feature_importance_file', pa.string()), ('shap_plot_file', pa.string()),
+    ('top_individuals_file', pa.string()), ('summary_report_file', pa.string()),
+])
+
+# Device XGBoost trains on; set to 'cuda' on a GPU host.
+XGB_DEVICE = 'cpu'
+
+# Number of histogram bins XGBoost quantizes each feature into.
+XGB_MAX_BIN = 256
+
+# Maximum number of training rows the Logistic Regression baseline is fitted on.
+LR_BASELINE_SAMPLE_SIZE = 200_000
+
+# Number of sampled XGBoost hyperparameter candidates (each is fitted on 2 CV folds).
+XGB_SEARCH_ITERATIONS = 8
+
+# Number of validation rows in the shared SHAP background sample; they are also the rows
+# explained for the SHAP summary plot.
+SHAP_BACKGROUND_SIZE = 512
+
+# Number of targets modeled at once; None splits the available cores between them.
+N_TARGET_WORKERS = None
+
+# Identifiers, metadata, and target variables that must never be used as model features.
+NON_FEATURE_SET = frozenset([
+    'member_id', 'event_date', 'dob', 'dataset_split', 'period',
+    'gender', 'engagement_group', 'normalized_coverage_category',
+    'y_ed_30d', 'y_ed_60d', 'y_ed_90d', 'y_ip_30d', 'y_ip_60d', 'y_ip_90d',
+    'y_any_30d', 'y_any_60d', 'y_any_90d', 'has_care_notes_post_period'
+])
+
+def write_run_summaries(run_summaries):
+    """
+    Appends the summaries of one run to the master log in a single write.
+
+    Args:
+        run_summaries (list[dict]): One summary dictionary per target; keys outside
+                                    `RUN_SUMMARY_SCHEMA` are ignored, missing ones are null.
+    """
+    if not run_summaries:
+        return
+    table = pa.Table.from_pylist(run_summaries, schema=RUN_SUMMARY_SCHEMA)
+    pq.write_to_dataset(table, log_summary_file, partition_cols=['analysis_type'])
+
 
 def setup_logger(analysis_name):
     """
@@ -99,7 +175,133 @@ def setup_logger(analysis_name):
     return logger, log_filepath
 
 
-def prepare_and_run_models(df, analysis_name, target='ip_event_next_30d', base_output='model_output.csv', logger=None, run_summary=None):
+def select_numeric_features(df):
+    """
+    Identifies the numeric model feature columns of a dataset.
+
+    Feature columns are all columns except identifiers, metadata, and target
+    variables (any column containing '_next_'). Only numeric columns are kept.
+
+    Args:
+        df (pd.DataFrame): The input DataFrame containing all features and metadata.
+
+    Returns:
+        pd.Index: The numeric feature column names, in DataFrame order.
+    """
+    features = [col for col in df.columns if col not in NON_FEATURE_SET and '_next_' not in col]
+    # The dtypes are read from an empty frame so no rows are copied just to find the numeric columns.
+    return df.head(0)[features].select_dtypes(include=['number']).columns
+
+
+def build_feature_matrix(df, numeric_features):
+    """
+    Converts the feature columns to one float32 block in a single pass and fills any
+    NaNs with 0 in place. XGBoost works in float32 internally, so nothing is lost
+    against float64.
+
+    Args:
+        df (pd.DataFrame): The input DataFrame.
+        numeric_features (pd.Index): The numeric feature columns.
+
+    Returns:
+        np.ndarray: A (rows, features) float32 array.
+    """
+    feature_matrix = df[numeric_features].to_numpy(dtype=np.float32)
+    feature_matrix[np.isnan(feature_matrix)] = 0
+    return feature_matrix
+
+
+def tune_xgboost(X_train, y_train, scale_pos_weight, logger, n_jobs=None):
+    """
+    Tunes and trains the XGBoost model with the native training API.
+
+    Each candidate from a seeded random sample of hyperparameters is scored by its
+    mean ROC AUC over 2 stratified folds. The folds are quantized into
+    `QuantileDMatrix` objects once and shared by every candidate, instead of the
+    scikit-learn wrapper rebuilding a DMatrix for each fit.
+
+    Args:
+        X_train (pd.DataFrame): The training features.
+        y_train (pd.Series): The training labels.
+        scale_pos_weight (float): The negative-to-positive class ratio.
+        logger (logging.Logger): The logger instance for detailed logging.
+        n_jobs (int, optional): The number of threads XGBoost may use; None uses all cores.
+
+    Returns:
+        tuple: The `xgb.Booster` trained on all of X_train with the best parameters,
+               and the best parameters as a dict.
+    """
+    # The histogram method bins each feature once into max_bin buckets, so split finding
+    # scales with the bin count instead of the number of distinct values.
+    base_params = {
+        'objective': 'binary:logistic', 'eval_metric': 'auc', 'scale_pos_weight': scale_pos_weight,
+        'tree_method': 'hist', 'max_bin': XGB_MAX_BIN, 'device': XGB_DEVICE, 'seed': 42,
+    }
+    if n_jobs is not None:
+        base_params['nthread'] = n_jobs
+
+    # Sample the hyperparameters from wide ranges rather than a fixed grid. AUC varies
+    # smoothly over these ranges, so the same number of fits as the old 2x2x2 grid
+    # covers a much larger space.
+    param_distributions = {
+        'n_estimators': randint(50, 301), 'max_depth': randint(3, 9), 'learning_rate': loguniform(0.01, 0.3),
+    }
+
+    # Quantize each fold once; the evaluation half reuses the bins of its training half.
+    folds = []
+    for train_idx, test_idx in StratifiedKFold(n_splits=2).split(X_train, y_train):
+        dtrain_fold = xgb.QuantileDMatrix(X_train.iloc[train_idx], label=y_train.iloc[train_idx], max_bin=XGB_MAX_BIN)
+        dtest_fold = xgb.QuantileDMatrix(X_train.iloc[test_idx], ref=dtrain_fold)
+        folds.append((dtrain_fold, dtest_fold, y_train.iloc[test_idx].to_numpy()))
+
+    logger.info("Starting hyperparameter search...")
+    best_auc, best_params = -np.inf, None
+    for candidate in ParameterSampler(param_distributions, n_iter=XGB_SEARCH_ITERATIONS, random_state=42):
+        params = {**base_params, 'max_depth': candidate['max_depth'], 'learning_rate': candidate['learning_rate']}
+        fold_aucs = [
+            roc_auc_score(y_test_fold, xgb.train(params, dtrain_fold, num_boost_round=candidate['n_estimators']).predict(dtest_fold))
+            for dtrain_fold, dtest_fold, y_test_fold in folds
+        ]
+        mean_auc = np.mean(fold_aucs)
+        logger.info(f"Candidate {candidate}: mean CV AUC {mean_auc:.4f}")
+        if mean_auc > best_auc:
+            best_auc, best_params = mean_auc, candidate
+    logger.info("Hyperparameter search complete.")
+    del folds
+
+    # Refit the best candidate on the full training set.
+    dtrain = xgb.QuantileDMatrix(X_train, label=y_train, max_bin=XGB_MAX_BIN)
+    params = {**base_params, 'max_depth': best_params['max_depth'], 'learning_rate': best_params['learning_rate']}
+    booster = xgb.train(params, dtrain, num_boost_round=best_params['n_estimators'])
+    return booster, best_params
+
+
+def gain_importances(booster, feature_names):
+    """
+    Returns the booster's average-gain (gain per split) feature importances normalized to sum to 1,
+    in the order of `feature_names` (features never used in a split score 0).
+    """
+    gain = booster.get_score(importance_type='gain')
+    importances = np.array([gain.get(feature, 0.0) for feature in feature_names], dtype=np.float32)
+    total = importances.sum()
+    return importances / total if total > 0 else importances
+
+
+def format_confusion_matrix(cm):
+    """
+    Formats a 2x2 confusion matrix as a labeled text table, laid out as pandas would
+    print it, without building a DataFrame.
+    """
+    columns = ['Predicted Negative', 'Predicted Positive']
+    lines = [f"{'':15}  {columns[0]:>18}  {columns[1]:>18}"]
+    for label, (negative, positive) in zip(['Actual Negative', 'Actual Positive'], cm):
+        lines.append(f"{label:15}  {negative:>18}  {positive:>18}")
+    return '\n'.join(lines)
+
+
+def prepare_and_run_models(df, analysis_name, target='ip_event_next_30d', base_output='model_output.csv', logger=None, run_summary=None,
+                           train_mask=None, val_mask=None, numeric_features=None, n_jobs=None, skip_baseline=False,
+                           shap_background=None, feature_matrix=None):
     """
     Prepares data, trains, evaluates, and saves models and their outputs.
 
@@ -113,6 +315,17 @@ def prepare_and_run_models(df, analysis_name, target='ip_event_next_30d', base_o
         base_output (str): The base path for all output files for this run.
         logger (logging.Logger): The logger instance for detailed logging.
         run_summary (dict): A dictionary to accumulate summary metrics for the master log.
+        train_mask (np.ndarray, optional): Boolean mask of the TRAIN rows in `df`.
+        val_mask (np.ndarray, optional): Boolean mask of the TEST rows in `df`.
+        numeric_features (pd.Index, optional): The numeric feature columns, as returned
+            by `select_numeric_features(df)`.
+        n_jobs (int, optional): The number of threads XGBoost may use; None uses all cores.
+        skip_baseline (bool): If True, the Logistic Regression baseline is not trained.
+        shap_background (pd.DataFrame, optional): Validation feature rows shared by every
+            target as the SHAP background; sampled from this target's rows if omitted.
+        feature_matrix (np.ndarray, optional): The NaN-filled float32 values of
+            `numeric_features` for every row of `df`, as returned by
+            `build_feature_matrix`; built from `df` if omitted.
     """
     if df.empty:
         logger.warning(f"No data to analyze for '{analysis_name}'. Skipping model training.")
@@ -126,39 +339,42 @@ def prepare_and_run_models(df, analysis_name, target='ip_event_next_30d', base_o
     run_summary['initial_rows'] = df.shape[0]
     
     # Split data into training and testing sets based on the 'dataset_split' column.
-    train_df = df[df['dataset_split'] == 'TRAIN'].copy()
-    val_df = df[df['dataset_split'] == 'TEST'].copy()
-    
+    # The masks can be computed once by the caller and shared across targets.
+    if train_mask is None:
+        train_mask = df['dataset_split'].eq('TRAIN').to_numpy()
+    if val_mask is None:
+        val_mask = df['dataset_split'].eq('TEST').to_numpy()
+
     # Drop rows with missing values in the target variable to ensure clean training.
-    initial_train_rows = len(train_df)
-    initial_val_rows = len(val_df)
-    train_df.dropna(subset=[target], inplace=True)
-    val_df.dropna(subset=[target], inplace=True)
-    logger.info(f"Dropped {initial_train_rows - len(train_df)} rows from training set due to NaN in target '{target}'.")
-    logger.info(f"Dropped {initial_val_rows - len(val_df)} rows from validation set due to NaN in target '{target}'.")
-    run_summary['training_rows_after_cleaning'] = len(train_df)
-    run_summary['validation_rows_after_cleaning'] = len(val_df)
-
-    # Dynamically identify feature columns by excluding identifiers, metadata, and all target variables.
-    non_feature_cols = [
-        'member_id', 'event_date', 'dob', 'dataset_split', 'period',
-        'gender', 'engagement_group', 'normalized_coverage_category',
-        'y_ed_30d', 'y_ed_60d', 'y_ed_90d', 'y_ip_30d', 'y_ip_60d', 'y_ip_90d',
-        'y_any_30d', 'y_any_60d', 'y_any_90d', 'has_care_notes_post_period'
-    ] + [col for col in df.columns if '_next_' in col]
-    
-    features = [col for col in df.columns if col not in non_feature_cols]
-    # Ensure only numeric types are used for modeling and fill any remaining NaNs with 0.
-    X_train = train_df[features].select_dtypes(include=['number']).fillna(0)
-    y_train = train_df[target]
+    target_values = df[target].to_numpy()
+    target_present = df[target].notna().to_numpy()
+    train_idx = np.flatnonzero(train_mask & target_present)
+    val_idx = np.flatnonzero(val_mask & target_present)
+    logger.info(f"Dropped {np.count_nonzero(train_mask & ~target_present)} rows from training set due to NaN in target '{target}'.")
+    logger.info(f"Dropped {np.count_nonzero(val_mask & ~target_present)} rows from validation set due to NaN in target '{target}'.")
+    run_summary['training_rows_after_cleaning'] = len(train_idx)
+    run_summary['validation_rows_after_cleaning'] = len(val_idx)
+
+    # The numeric feature columns are shared by every target, so the caller normally
+    # passes them in; otherwise derive them from this frame.
+    if numeric_features is None:
+        numeric_features = select_numeric_features(df)
+
+    # The feature block is the same for every target, so the caller normally converts it
+    # once and passes it in; the train and validation rows are gathered from it directly.
+    # The 0/1 labels fit in int8.
+    if feature_matrix is None:
+        feature_matrix = build_feature_matrix(df, numeric_features)
+    X_train = pd.DataFrame(feature_matrix[train_idx], columns=numeric_features, copy=False)
+    y_train = pd.Series(target_values[train_idx].astype(np.int8), name=target)
     
-    # Ensure validation set has the same columns as the training set.
-    X_val = val_df[features].select_dtypes(include=['number']).fillna(0)
-    y_val = val_df[target]
-
-    # Align columns - crucial for preventing feature mismatch errors
-    train_cols = X_train.columns
-    X_val = X_val.reindex(columns=train_cols, fill_value=0)
+    # Only the identifying columns and the outcome of the validation rows are written out with
+    # the predictions, so only those are copied. The validation features use the same column
+    # list as X_train, so they need no realignment.
+    val_df = df[['member_id', 'event_date', target]].take(val_idx)
+    X_val = pd.DataFrame(feature_matrix[val_idx], columns=numeric_features, copy=False)
+    y_val = pd.Series(target_values[val_idx].astype(np.int8), name=target)
+    del feature_matrix
 
     if X_val.empty:
         logger.warning(f"Validation set is empty for target '{target}' after cleaning. Skipping evaluation.")
@@ -170,59 +386,70 @@ def prepare_and_run_models(df, analysis_name, target='ip_event_next_30d', base_o
     run_summary['feature_count'] = X_train.shape[1]
 
     # B) Running a Baseline Model (Logistic Regression) for comparison
-    logger.info("--- Running Logistic Regression Baseline ---")
-    lr_model = LogisticRegression(solver='liblinear', random_state=42)
-    lr_model.fit(X_train, y_train)
-    lr_pred = lr_model.predict(X_val)
-    
-    lr_accuracy = accuracy_score(y_val, lr_pred)
-    logger.info(f"Logistic Regression Accuracy: {lr_accuracy:.4f}")
-    logger.info("Classification Report (Logistic Regression):\n" + classification_report(y_val, lr_pred, zero_division=0))
+    if skip_baseline:
+        logger.info("--- Skipping Logistic Regression Baseline ---")
+        lr_pred, lr_accuracy = None, None
+    else:
+        logger.info("--- Running Logistic Regression Baseline ---")
+        # The baseline is only a point of comparison, so it is fitted on a bounded random
+        # sample. saga on standardized features converges in a fixed number of passes,
+        # where liblinear's cost grows with every row of the full training set.
+        if len(X_train) > LR_BASELINE_SAMPLE_SIZE:
+            sample_idx = np.random.default_rng(42).choice(len(X_train), size=LR_BASELINE_SAMPLE_SIZE, replace=False)
+            X_lr, y_lr = X_train.iloc[sample_idx], y_train.iloc[sample_idx]
+        else:
+            X_lr, y_lr = X_train, y_train
+        lr_model = make_pipeline(StandardScaler(), LogisticRegression(solver='saga', max_iter=100, random_state=42))
+        lr_model.fit(X_lr, y_lr)
+        del X_lr, y_lr
+        lr_pred = lr_model.predict(X_val)
+        
+        lr_accuracy = accuracy_score(y_val, lr_pred)
+        logger.info(f"Logistic Regression Accuracy: {lr_accuracy:.4f}")
+        lr_report = classification_report(y_val, lr_pred, zero_division=0)
+        logger.info("Classification Report (Logistic Regression):\n" + lr_report)
     run_summary['lr_accuracy'] = lr_accuracy
 
     # C) Train the primary XGBoost model with hyperparameter tuning
     logger.info("--- Training XGBoost model with Hyperparameter Tuning ---")
     # Calculate scale_pos_weight to handle class imbalance, which is common in risk prediction.
-    scale_pos_weight = y_train.value_counts()[0] / y_train.value_counts()[1] if y_train.value_counts()[1] > 0 else 1
+    # It depends only on the labels, so it is computed once for every search candidate.
+    class_counts = y_train.value_counts()
+    scale_pos_weight = class_counts[0] / class_counts[1] if class_counts[1] > 0 else 1
     logger.info(f"Calculated scale_pos_weight for imbalance: {scale_pos_weight:.2f}")
 
-    # Define a small grid of parameters for efficient tuning.
-    param_grid = {
-        'n_estimators': [50, 100], 'max_depth': [3, 5], 'learning_rate': [0.1, 0.01],
-    }
-    model = XGBClassifier(objective='binary:logistic', eval_metric='auc', use_label_encoder=False, scale_pos_weight=scale_pos_weight, random_state=42)
-    
-    # Use GridSearchCV to find the best model parameters based on ROC AUC.
-    grid_search = GridSearchCV(estimator=model, param_grid=param_grid, scoring='roc_auc', cv=2, verbose=1, n_jobs=2)
-    logger.info("Starting hyperparameter grid search...")
-    grid_search.fit(X_train, y_train)
-    logger.info("Hyperparameter grid search complete.")
-    best_model = grid_search.best_estimator_
-    logger.info(f"Hyperparameter Tuning Complete. Best parameters found: {grid_search.best_params_}")
-    run_summary['xgb_best_params'] = str(grid_search.best_params_)
+    best_model, best_params = tune_xgboost(X_train, y_train, scale_pos_weight, logger, n_jobs=n_jobs)
+    # The training matrix is not needed past this point; free it before scoring and SHAP.
+    del X_train, y_train
+    logger.info(f"Hyperparameter Tuning Complete. Best parameters found: {best_params}")
+    run_summary['xgb_best_params'] = str(best_params)
 
     # D) Evaluate the tuned model on the validation set
     logger.info("--- Validation Set Performance (XGBoost) ---")
-    y_val_pred_proba = best_model.predict_proba(X_val)[:, 1]
-    y_val_pred = best_model.predict(X_val)
+    y_val_pred_proba = best_model.inplace_predict(X_val)
+    y_val_pred = (y_val_pred_proba > 0.5).astype(int)
     xgb_accuracy = accuracy_score(y_val, y_val_pred)
     xgb_auc = roc_auc_score(y_val, y_val_pred_proba)
     logger.info(f"XGBoost Accuracy: {xgb_accuracy:.4f}")
     logger.info(f"XGBoost AUC Score: {xgb_auc:.4f}")
-    logger.info("Confusion Matrix (XGBoost):\n" + str(pd.DataFrame(confusion_matrix(y_val, y_val_pred), index=['Actual Negative', 'Actual Positive'], columns=['Predicted Negative', 'Predicted Positive'])))
-    logger.info("Classification Report (XGBoost):\n" + classification_report(y_val, y_val_pred, zero_division=0))
+    # Build the report strings once; they are logged here and written to the summary file.
+    xgb_confusion = format_confusion_matrix(confusion_matrix(y_val, y_val_pred, labels=[0, 1]))
+    xgb_report = classification_report(y_val, y_val_pred, zero_division=0)
+    logger.info("Confusion Matrix (XGBoost):\n" + xgb_confusion)
+    logger.info("Classification Report (XGBoost):\n" + xgb_report)
     run_summary['xgb_accuracy'] = xgb_accuracy
     run_summary['xgb_auc'] = xgb_auc
 
     # Save model predictions and feature importances to files
     logger.info("Saving model output and feature importances...")
-    output_path = base_output
+    # Predictions are written as compressed Parquet with just the identifying columns, the
+    # actual outcome, and the model output, rather than every feature serialized as text.
+    output_path = os.path.splitext(base_output)[0] + '.parquet'
     importances_path = base_output.replace('.csv', '_feature_importances.csv')
-    val_df_copy = val_df.copy()
-    val_df_copy['predicted_proba'] = best_model.predict_proba(X_val)[:, 1]
-    val_df_copy['predicted_label'] = best_model.predict(X_val)
-    importances_df = pd.DataFrame({'feature': X_val.columns, 'importance': best_model.feature_importances_}).sort_values(by='importance', ascending=False)
-    val_df_copy.to_csv(output_path, index=False)
+    val_df['predicted_proba'] = y_val_pred_proba
+    val_df['predicted_label'] = y_val_pred
+    importances_df = pd.DataFrame({'feature': X_val.columns, 'importance': gain_importances(best_model, X_val.columns)}).sort_values(by='importance', ascending=False)
+    val_df.to_parquet(output_path, engine='pyarrow', compression='zstd', index=False)
     importances_df.to_csv(importances_path, index=False)
     logger.info(f"Model predictions saved to {output_path}")
     logger.info(f"Feature importances saved to {importances_path}")
@@ -231,11 +458,16 @@ def prepare_and_run_models(df, analysis_name, target='ip_event_next_30d', base_o
 
     # E) Perform SHAP analysis for model interpretability
     logger.info("--- Running SHAP Analysis ---")
-    explainer = shap.TreeExplainer(best_model)
-    shap_values = explainer.shap_values(X_val)
-    import matplotlib.pyplot as plt
+    # Every target shares the feature schema, so one background sample of validation rows,
+    # drawn once by the caller, serves as both the reference data and the rows explained.
+    # The summary plot looks the same on a few hundred rows as on the whole validation set.
+    if shap_background is None:
+        shap_background = shap.sample(X_val, SHAP_BACKGROUND_SIZE, random_state=42)
+    explainer = shap.TreeExplainer(best_model, data=shap_background, model_output='raw', feature_perturbation='interventional')
+    X_shap = shap_background
+    shap_values = explainer.shap_values(X_shap, check_additivity=False)
     plt.figure(figsize=(12, 6))
-    shap.summary_plot(shap_values, X_val, show=False, plot_size="auto")
+    shap.summary_plot(shap_values, X_shap, show=False, plot_size="auto")
     shap_path = os.path.splitext(base_output)[0] + f"_{target}_SHAP.png"
     plt.savefig(shap_path, bbox_inches='tight')
     plt.close()
@@ -243,13 +475,16 @@ def prepare_and_run_models(df, analysis_name, target='ip_event_next_30d', base_o
     run_summary['shap_plot_file'] = shap_path
 
     # F) Identify and save the top N individuals with the highest predicted risk
-    top_n = 20 if len(val_df_copy) > 20 else len(val_df_copy)
-    val_df_copy['fh_id'] = val_df_copy['predicted_proba']
-    top_individuals = val_df_copy[['fh_id', 'predicted_proba']].sort_values('predicted_proba', ascending=False)
+    top_n = 20 if len(val_df) > 20 else len(val_df)
+    # Partition out the N highest scores and sort only those, instead of sorting the whole set.
+    top_idx = np.argpartition(-y_val_pred_proba, top_n - 1)[:top_n]
+    top_idx = top_idx[np.argsort(-y_val_pred_proba[top_idx], kind='stable')]
+    top_individuals = val_df[['member_id', 'predicted_proba']].iloc[top_idx]
     top_out = os.path.splitext(base_output)[0] + f"_{target}_top.csv"
-    top_individuals.head(top_n).to_csv(top_out, index=False)
+    top_individuals.to_csv(top_out, index=False)
     logger.info(f"Top {top_n} individuals for {target} saved to {top_out}")
     run_summary['top_individuals_file'] = top_out
+    del val_df, top_individuals
 
     # G) Save a comprehensive text summary of the results
     summary_path = os.path.splitext(base_output)[0] + f"_{target}_summary.txt"
@@ -257,29 +492,106 @@ def prepare_and_run_models(df, analysis_name, target='ip_event_next_30d', base_o
         f.write(f"Analysis Name: {analysis_name}\n")
         f.write(f"Dependent variable: {target}\n")
         f.write("\n--- Logistic Regression Results (Validation) ---\n")
-        f.write(f"Accuracy: {lr_accuracy:.4f}\n")
-        f.write("Classification Report:\n")
-        f.write(classification_report(y_val, lr_pred, zero_division=0))
+        if lr_pred is None:
+            f.write("Skipped (--skip-baseline).\n")
+        else:
+            f.write(f"Accuracy: {lr_accuracy:.4f}\n")
+            f.write("Classification Report:\n")
+            f.write(lr_report)
         f.write("\n\n--- XGBoost Validation Results ---\n")
-        f.write(f"Best Parameters: {grid_search.best_params_}\n")
+        f.write(f"Best Parameters: {best_params}\n")
         f.write(f"Accuracy: {xgb_accuracy:.4f}\n")
         f.write(f"AUC Score: {xgb_auc:.4f}\n")
         f.write("Confusion Matrix:\n")
-        f.write(str(pd.DataFrame(confusion_matrix(y_val, y_val_pred), index=['Actual Negative', 'Actual Positive'], columns=['Predicted Negative', 'Predicted Positive'])))
+        f.write(xgb_confusion)
         f.write("\nClassification Report:\n")
-        f.write(classification_report(y_val, y_val_pred, zero_division=0))
+        f.write(xgb_report)
     logger.info(f"Summary results for {target} saved to {summary_path}")
     run_summary['summary_report_file'] = summary_path
 
 
-def main():
+def run_target(dataset_path, features_path, analysis_name, target, base_output_dir, run_summary,
+               train_mask, val_mask, numeric_features, n_jobs, skip_baseline=False, shap_background=None):
+    """
+    Runs the modeling pipeline for one target; the per-worker entry point.
+
+    The worker reads the shared dataset back from its Parquet copy, memory-maps the
+    shared feature matrix, and logs to its own file, so targets can be modeled in
+    separate processes. A failure is recorded in the returned summary rather than
+    raised, so it does not stop the other targets.
+
+    Args:
+        dataset_path (str): Path of the Parquet copy of the analysis dataset's
+                            identifier and target columns.
+        features_path (str): Path of the `.npy` copy of the dataset's feature matrix.
+        analysis_name (str): The name of the analysis run.
+        target (str): The target variable to model.
+        base_output_dir (str): The directory for this run's output files.
+        run_summary (dict): The base run summary, filled in for this target.
+        train_mask (np.ndarray): Boolean mask of the TRAIN rows in the dataset.
+        val_mask (np.ndarray): Boolean mask of the TEST rows in the dataset.
+        numeric_features (pd.Index): The numeric feature columns.
+        n_jobs (int): The number of threads XGBoost may use.
+        skip_baseline (bool): If True, the Logistic Regression baseline is not trained.
+        shap_background (pd.DataFrame, optional): The shared SHAP background sample.
+
+    Returns:
+        dict: The run summary for this target.
+    """
+    logger, log_filepath = setup_logger(f"{analysis_name} {target}")
+    logger.info(f"--- Starting process for target: {target} ---")
+    run_summary['log_file'] = log_filepath
+    run_summary['target_variable'] = target
+
+    try:
+        # Only the identifiers and this target are read back; the other targets and the
+        # metadata columns never enter the worker's memory. The feature matrix is mapped
+        # read-only, so only the train and validation rows gathered from it are copied.
+        df = pd.read_parquet(dataset_path, columns=['member_id', 'event_date', target])
+        feature_matrix = np.load(features_path, mmap_mode='r')
+
+        # Define the output file for this specific target's predictions.
+        base_output_file = os.path.join(base_output_dir, f"{target}_predictions.csv")
+
+        # Run the modeling pipeline.
+        prepare_and_run_models(
+            df,
+            f"{analysis_name} - {target}",
+            target=target,
+            base_output=base_output_file,
+            logger=logger,
+            run_summary=run_summary,
+            train_mask=train_mask,
+            val_mask=val_mask,
+            numeric_features=numeric_features,
+            n_jobs=n_jobs,
+            skip_baseline=skip_baseline,
+            shap_background=shap_background,
+            feature_matrix=feature_matrix
+        )
+        run_summary['status'] = 'COMPLETED'
+    except Exception as e:
+        logger.error(f"An unhandled exception occurred for target {target}: {e}", exc_info=True)
+        run_summary['status'] = f'FAILED - {e}'
+    finally:
+        # Release any figure left open, e.g. by a failed plot, before the worker's next target.
+        plt.close('all')
+    return run_summary
+
+
+def main(refresh_cache=False, skip_baseline=False):
     """
     Main function to orchestrate the model training and evaluation pipeline.
 
     This function provides an interactive command-line interface to guide the user
     through selecting an analysis type, running models for multiple
-    targets, and logging the results. It is optimized to be memory-efficient
-    by fetching data from Snowflake for one target at a time.
+    targets, and logging the results. The dataset is fetched from Snowflake once
+    and shared by every target, since all targets are modeled from the same rows.
+
+    Args:
+        refresh_cache (bool): If True, re-query Snowflake even when a fresh local
+                              Parquet cache of the dataset exists.
+        skip_baseline (bool): If True, the Logistic Regression baseline is not trained.
     """
     # --- Setup for a specific run ---
     run_timestamp = datetime.now()
@@ -316,6 +628,11 @@ def main():
         'status': 'STARTED'
     }
 
+    # Summaries of every target are collected here and logged once at the end.
+    run_summaries = []
+    # Temporary directory holding the dataset copies handed to the workers.
+    handoff_dir = None
+
     try:
         # --- Step 2: Define the Snowflake query and target variables ---
         query_map = {
@@ -337,81 +654,103 @@ def main():
             os.makedirs(base_output_dir)
         logger.info(f"All outputs will be saved in the directory: {base_output_dir}")
 
-        # --- Step 3: Loop through each target, fetch data, and run the model ---
-        # This approach loads data one target at a time to conserve memory.
-        for target in target_vars:
-            logger.info(f"--- Starting process for target: {target} ---")
-            
-            # Create a fresh copy of the run summary for this specific target.
-            target_run_summary = base_run_summary.copy()
-            target_run_summary['target_variable'] = target
-
-            # Fetch data from Snowflake for the current target analysis.
-            df = pd.DataFrame()
-            logger.info(f"Fetching data from Snowflake for: {analysis_name} using streaming...")
-            data_chunks = []
+        # --- Step 3: Fetch the dataset once; every target is modeled from the same rows ---
+        # The queries are deterministic, so a recent local copy keyed by the query text
+        # stands in for the Snowflake round trip.
+        cache_key = f"riskgrouper_{hashlib.sha1(query.encode()).hexdigest()}"
+        if is_cache_valid(cache_key, force_refresh=refresh_cache):
+            df = load_from_cache(cache_key)
+        else:
+            logger.info(f"Fetching data from Snowflake for: {analysis_name} as an Arrow table...")
+            # One connection serves the whole analysis; it is opened only on a cache miss and
+            # closed as soon as the table is fetched rather than held open while models train.
+            table = None
             with SnowflakeConnector() as sf:
                 if sf.connection:
-                    for chunk in sf.streaming(query):
-                        data_chunks.append(chunk)
-
-            df = pd.concat(data_chunks, ignore_index=True) if data_chunks else pd.DataFrame()
-            
-            if df is None or df.empty:
-                logger.error(f"No data returned from Snowflake for target {target}. Skipping.")
+                    table = sf.query_to_arrow(query)
+
+            # Convert column by column and release each Arrow buffer as it is converted,
+            # so the result is never held twice in memory.
+            df = table.to_pandas(split_blocks=True, self_destruct=True) if table is not None else pd.DataFrame()
+            del table
+            if not df.empty:
+                save_to_cache(df, cache_key)
+
+        if df.empty:
+            logger.error(f"No data returned from Snowflake for {analysis_name}. Skipping all targets.")
+            # Log one failure row per target so the audit trail still covers each of them.
+            for target in target_vars:
+                target_run_summary = base_run_summary.copy()
+                target_run_summary['target_variable'] = target
                 target_run_summary['status'] = 'FAILED - NO DATA'
-                # Log the failure and continue to the next target.
-                summary_df = pd.DataFrame([target_run_summary])
-                if os.path.exists(log_summary_file):
-                    summary_df.to_csv(log_summary_file, mode='a', header=False, index=False)
-                else:
-                    summary_df.to_csv(log_summary_file, mode='w', header=True, index=False)
-                continue
-
-            # Standardize column names to lower case for consistency.
-            df.columns = [col.lower() for col in df.columns]
-            logger.info(f"Successfully loaded {len(df)} records for target {target}.")
-
-            # Define the output file for this specific target's predictions.
-            base_output_file = os.path.join(base_output_dir, f"{target}_predictions.csv")
-            
-            # Run the modeling pipeline.
-            prepare_and_run_models(
-                df, 
-                f"{analysis_name} - {target}", 
-                target=target, 
-                base_output=base_output_file, 
-                logger=logger, 
-                run_summary=target_run_summary
+                run_summaries.append(target_run_summary)
+            return
+
+        # Standardize column names to lower case for consistency.
+        df.columns = [col.lower() for col in df.columns]
+        logger.info(f"Successfully loaded {len(df)} records.")
+
+        # The train/validation split and the features are the same for every target, so
+        # mask the split and convert the feature block to float32 once, not once per target.
+        train_mask = df['dataset_split'].eq('TRAIN').to_numpy()
+        val_mask = df['dataset_split'].eq('TEST').to_numpy()
+        numeric_features = select_numeric_features(df)
+        feature_matrix = build_feature_matrix(df, numeric_features)
+
+        # One SHAP background sample of validation rows is shared by every target's explainer.
+        # The row positions are sampled first so only the sampled rows are copied.
+        background_idx = shap.sample(np.flatnonzero(val_mask), SHAP_BACKGROUND_SIZE, random_state=42)
+        shap_background = pd.DataFrame(feature_matrix[background_idx], columns=numeric_features)
+
+        # Materialise the dataset once; each worker reads it back instead of receiving
+        # a pickled copy of the full frame. The features go to a raw .npy file that the
+        # workers memory-map, and the remaining columns to Parquet. Both are temporary
+        # and removed once the workers finish.
+        handoff_dir = tempfile.mkdtemp(prefix='riskgrouper_')
+        dataset_path = os.path.join(handoff_dir, 'analysis_dataset.parquet')
+        features_path = os.path.join(handoff_dir, 'analysis_features.npy')
+        np.save(features_path, feature_matrix)
+        df.drop(columns=numeric_features).to_parquet(dataset_path, index=False, compression='zstd')
+        del df, feature_matrix
+        gc.collect()
+
+        # --- Step 4: Model the targets in parallel, one worker process per target ---
+        # The cores are split between the workers, and each worker gives its share to
+        # XGBoost, so the hyperparameter search itself runs serially and nothing is oversubscribed.
+        cpu_count = os.cpu_count() or 1
+        n_workers = N_TARGET_WORKERS or max(1, min(len(target_vars), cpu_count // 2))
+        cores_per_worker = max(1, cpu_count // n_workers)
+        logger.info(f"Modeling {len(target_vars)} targets with {n_workers} worker(s), {cores_per_worker} core(s) each.")
+        run_summaries.extend(Parallel(n_jobs=n_workers, backend='loky')(
+            delayed(run_target)(
+                dataset_path, features_path, analysis_name, target, base_output_dir, base_run_summary.copy(),
+                train_mask, val_mask, numeric_features, cores_per_worker, skip_baseline, shap_background
             )
-            
-            # After the run, update status and log the summary for this target.
-            target_run_summary['status'] = 'COMPLETED'
-            summary_df = pd.DataFrame([target_run_summary])
-            if os.path.exists(log_summary_file):
-                summary_df.to_csv(log_summary_file, mode='a', header=False, index=False)
-            else:
-                summary_df.to_csv(log_summary_file, mode='w', header=True, index=False)
-            
-            # Explicitly free memory to prevent crashes on the next loop
-            logger.info(f"Releasing memory after processing target: {target}")
-            del df
-            import gc
-            gc.collect()
-            logger.info("Memory cleanup complete.")
+            for target in target_vars
+        ))
 
     except Exception as e:
         logger.error(f"An unhandled exception occurred in main loop: {e}", exc_info=True)
         base_run_summary['status'] = f'FAILED - {e}'
-        # Log the failure to the summary file.
-        summary_df = pd.DataFrame([base_run_summary])
-        if os.path.exists(log_summary_file):
-            summary_df.to_csv(log_summary_file, mode='a', header=False, index=False)
-        else:
-            summary_df.to_csv(log_summary_file, mode='w', header=True, index=False)
+        run_summaries.append(base_run_summary)
     finally:
+        if handoff_dir is not None:
+            shutil.rmtree(handoff_dir, ignore_errors=True)
+        # Log every summary of this run to the master log in a single write.
+        write_run_summaries(run_summaries)
         logger.info(f"All analyses complete. Master run summary saved to {log_summary_file}")
 
 
+def parse_args():
+    """Parses the command-line flags for the model runner."""
+    parser = argparse.ArgumentParser(description="Risk Grouper ML Model Runner (XGBoost)")
+    parser.add_argument('--refresh-cache', action='store_true',
+                        help="Re-query Snowflake even if a fresh local cache of the dataset exists.")
+    parser.add_argument('--skip-baseline', action='store_true',
+                        help="Skip the Logistic Regression baseline and train only XGBoost.")
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    main(refresh_cache=args.refresh_cache, skip_baseline=args.skip_baseline)
@@ -1,17 +1,27 @@
 import pandas as pd
 import numpy as np
 from xgboost import XGBClassifier
-from sklearn.metrics import classification_report, precision_recall_curve, f1_score
+from sklearn.metrics import confusion_matrix, precision_recall_curve, f1_score
 from sklearn.linear_model import LogisticRegression
 from sklearn.model_selection import train_test_split, GridSearchCV
+import sklearn
+import xgboost
 from sklearn.calibration import CalibratedClassifierCV
 import os
+import hashlib
+import inspect
+import json
 import shap
 from snowflake_connector import SnowflakeConnector
+from caching import load_model, save_model
+from joblib import Memory
 import logging
 from datetime import datetime
-from imblearn.over_sampling import SMOTE
+import matplotlib
+matplotlib.use('Agg')  # Batch runs write the plot to disk; no GUI backend needed
 import matplotlib.pyplot as plt
+import pyarrow as pa
+import pyarrow.parquet as pq
 
 # --- Configuration & Setup ---
 LOG_DIR = 'logs'
@@ -19,6 +29,17 @@ if not os.path.exists(LOG_DIR):
     os.makedirs(LOG_DIR)
 log_summary_file = os.path.join(LOG_DIR, 'run_summary_log.csv')
 
+# The low-risk cutoff is the highest calibrated probability that still leaves this
+# share of validation events above it.
+LOW_RISK_TARGET_RECALL = 0.95
+
+# Reporting window: the most recent six effective months (inclusive)
+RECENT_START = pd.Timestamp('2024-07-01')
+RECENT_END = pd.Timestamp('2024-12-01')
+
+# Rows explained per TreeExplainer call when building the patient report
+SHAP_BATCH_SIZE = 50_000
+
 def setup_logger(analysis_name):
     """Sets up a logger for the analysis."""
     log_filename = datetime.now().strftime(f'{analysis_name.replace(" ", "_")}_%Y-%m-%d_%H-%M-%S.log')
@@ -35,69 +56,118 @@ def setup_logger(analysis_name):
         logger.addHandler(console_handler)
     return logger, log_filepath
 
+def to_row_major(X):
+    """Returns `X` as a float32 DataFrame backed by a single C-contiguous array."""
+    # pandas keeps a frame's values column by column, so the matrix the models get from
+    # it is Fortran-ordered and XGBoost, sklearn and SHAP each copy it to rows first.
+    # Wrapping one row-major array (copy=False keeps its layout) hands it over as is.
+    return pd.DataFrame(np.ascontiguousarray(X.to_numpy(), dtype=np.float32),
+                        index=X.index, columns=X.columns, copy=False)
+
 def prepare_data(df, target, features, logger):
     """
     Prepares data for modeling by splitting into train, validation, and test sets.
+
+    `features` must name numeric columns of `df`.
     """
     logger.info("--- Starting Data Preparation ---")
     if df.empty:
         logger.warning("DataFrame is empty. Cannot prepare data.")
         return None, None, None
 
-    # Member-Level Splitting to prevent data leakage
-    unique_member_ids = df['fh_id'].unique()
-    train_members, test_members = train_test_split(unique_member_ids, test_size=0.2, random_state=42)
+    # Member-Level Splitting to prevent data leakage. Members are encoded to integer
+    # codes once (missing ids form their own member, as with unique()), the split is
+    # drawn over the codes, and each row's split is then a single array lookup instead
+    # of three hash-based isin scans over the ids.
+    member_codes, unique_member_ids = pd.factorize(df['fh_id'], use_na_sentinel=False)
+    train_members, test_members = train_test_split(np.arange(len(unique_member_ids)), test_size=0.2, random_state=42)
     train_members, val_members = train_test_split(train_members, test_size=0.25, random_state=42)
     
     logger.info(f"Number of unique member IDs: {len(unique_member_ids)}")
     logger.info(f"Training members: {len(train_members)}, Validation members: {len(val_members)}, Test members: {len(test_members)}")
 
-    # Create dataframes for each split
-    train_df = df[df['fh_id'].isin(train_members)].copy().dropna(subset=[target])
-    val_df = df[df['fh_id'].isin(val_members)].copy().dropna(subset=[target])
-    test_df = df[df['fh_id'].isin(test_members)].copy().dropna(subset=[target])
+    member_split = np.empty(len(unique_member_ids), dtype=np.int8)
+    member_split[train_members], member_split[val_members], member_split[test_members] = 0, 1, 2
+    row_split = member_split[member_codes]
+    has_target = df[target].notna().to_numpy()
+
+    # Create dataframes for each split; take() makes the only copy, and the result
+    # is an independent frame that later column assignments can modify safely
+    train_df = df.take(np.flatnonzero((row_split == 0) & has_target))
+    val_df = df.take(np.flatnonzero((row_split == 1) & has_target))
+    test_df = df.take(np.flatnonzero((row_split == 2) & has_target))
 
     logger.info(f"Training shape: {train_df.shape}, Validation shape: {val_df.shape}, Test shape: {test_df.shape}")
 
     # Separate features and target
-    X_train = train_df[features].select_dtypes(include=['number']).fillna(0)
-    y_train = train_df[target]
+    # `features` holds only numeric columns, so every split gets the same columns in order
+    X_train = train_df[features].fillna(0)
+    y_train = train_df[target].astype(np.int8)
     
-    X_val = val_df[features].select_dtypes(include=['number']).fillna(0).reindex(columns=X_train.columns, fill_value=0)
-    y_val = val_df[target]
+    X_val = val_df[features].fillna(0)
+    y_val = val_df[target].astype(np.int8)
     
-    X_test = test_df[features].select_dtypes(include=['number']).fillna(0).reindex(columns=X_train.columns, fill_value=0)
-    y_test = test_df[target]
+    X_test = test_df[features].fillna(0)
+    y_test = test_df[target].astype(np.int8)
+
+    X_train = to_row_major(X_train)
+    X_val = to_row_major(X_val)
+    X_test = to_row_major(X_test)
 
     logger.info(f"Final shapes: Train {X_train.shape}, Val {X_val.shape}, Test {X_test.shape}")
     return (X_train, y_train), (X_val, y_val), (X_test, y_test), train_df, val_df, test_df
 
-def apply_smote(X_train, y_train, logger):
-    """Applies SMOTE to the training data to handle class imbalance."""
-    logger.info("Applying SMOTE to balance the training data.")
-    smote = SMOTE(random_state=42)
-    X_train_resampled, y_train_resampled = smote.fit_resample(X_train, y_train)
-    logger.info(f"Original training set size: {X_train.shape}, Resampled size: {X_train_resampled.shape}")
-    return X_train_resampled, y_train_resampled
+def train_models(X_train, y_train, X_val, y_val, logger):
+    """
+    Trains and returns the Logistic Regression and XGBoost models.
 
-def train_models(X_train, y_train, logger):
-    """Trains and returns the Logistic Regression and XGBoost models."""
+    The validation split is used only to stop XGBoost boosting once its AUC
+    stops improving. Class imbalance is handled by weighting the positive class
+    in both models rather than by resampling the training data.
+    """
     # Logistic Regression
     logger.info("Training Logistic Regression model.")
-    logistic_model = LogisticRegression(solver='liblinear', random_state=42)
+    logistic_model = LogisticRegression(solver='liblinear', class_weight='balanced', random_state=42)
     logistic_model.fit(X_train, y_train)
 
-    # XGBoost with GridSearchCV
-    logger.info("Training XGBoost model with GridSearchCV.")
-    xgb_model = XGBClassifier(objective='binary:logistic', eval_metric='auc', use_label_encoder=False, random_state=42)
-    param_grid = {'n_estimators': [50, 100], 'max_depth': [3, 5], 'learning_rate': [0.1, 0.01]}
+    # XGBoost with GridSearchCV. Early stopping picks the number of boosting rounds,
+    # so the grid only searches tree depth and learning rate.
+    scale_pos_weight = (y_train == 0).sum() / max((y_train == 1).sum(), 1)
+    logger.info(f"Training XGBoost model with GridSearchCV (scale_pos_weight={scale_pos_weight:.2f}).")
+    # The hist method bins the float32 features directly instead of sorting exact splits
+    xgb_model = XGBClassifier(objective='binary:logistic', eval_metric='auc', tree_method='hist',
+                              n_estimators=500, early_stopping_rounds=20, scale_pos_weight=scale_pos_weight,
+                              n_jobs=-1, random_state=42)
+    param_grid = {'max_depth': [3, 5], 'learning_rate': [0.1, 0.05]}
     grid_search = GridSearchCV(estimator=xgb_model, param_grid=param_grid, scoring='roc_auc', cv=2, verbose=1, n_jobs=-1)
-    grid_search.fit(X_train, y_train)
+    grid_search.fit(X_train, y_train, eval_set=[(X_val, y_val)], verbose=False)
     best_xgb_model = grid_search.best_estimator_
-    logger.info(f"Best XGBoost parameters: {grid_search.best_params_}")
+    logger.info(f"Best XGBoost parameters: {grid_search.best_params_}, boosting rounds: {best_xgb_model.best_iteration + 1}")
 
     return logistic_model, best_xgb_model
 
+# Identifies the model configuration in the fitted-model cache key: any edit to
+# train_models (grid, estimator parameters, early stopping) or a library upgrade
+# yields a new key, so stale models are never reused.
+MODEL_SIGNATURE = hashlib.sha256(
+    '\x1f'.join([inspect.getsource(train_models), sklearn.__version__, xgboost.__version__]).encode()
+).hexdigest()[:8]
+
+# Model training is deterministic (fixed random_state) and the slowest stage, so it is
+# memoised on disk keyed by its inputs, behind the fingerprint-keyed model cache that
+# run_pipeline checks first. Set PIPELINE_CACHE=0 to always recompute.
+if os.environ.get('PIPELINE_CACHE', '1') == '1':
+    pipeline_memory = Memory(os.path.join('cache', 'pipeline'), verbose=0, compress=3)
+    train_models = pipeline_memory.cache(train_models, ignore=['logger'])
+
+def training_fingerprint(X_train, y_train, X_val, y_val):
+    """Returns a short hash of the training inputs, used to key the fitted-model cache."""
+    digest = hashlib.sha256()
+    digest.update('\x1f'.join(X_train.columns).encode())
+    for arr in (X_train, y_train, X_val, y_val):
+        digest.update(np.ascontiguousarray(arr.to_numpy()).tobytes())
+    return digest.hexdigest()[:16]
+
 def optimize_thresholds(y_val, val_probs, logger):
     """Finds the optimal threshold for the XGBoost model using a Precision-Recall Curve."""
     precision, recall, thresholds = precision_recall_curve(y_val, val_probs)
@@ -109,77 +179,156 @@ def optimize_thresholds(y_val, val_probs, logger):
     
     return optimal_threshold
 
+def find_low_risk_threshold(y_true, probs, target_recall):
+    """Returns the largest threshold whose "at or above" group still captures `target_recall` of the events."""
+    order = np.argsort(-probs, kind='mergesort')
+    probs_sorted = probs[order]
+    recall = np.cumsum(np.asarray(y_true)[order]) / max(np.asarray(y_true).sum(), 1)
+    # recall is non-decreasing, so the first position reaching the target is the highest cut
+    return probs_sorted[min(np.searchsorted(recall, target_recall), len(probs_sorted) - 1)]
+
+def classification_metrics(y_true, y_pred):
+    """
+    Returns binary classification metrics as a dict, derived from one confusion matrix.
+
+    Keys are the class labels 0 and 1 (each a dict of precision, recall, f1-score and
+    support), 'accuracy', 'macro avg' and 'weighted avg', as in sklearn's
+    classification_report(output_dict=True). Undefined ratios are reported as 0.
+    """
+    cm = confusion_matrix(y_true, y_pred, labels=[0, 1])
+    tp = np.diag(cm).astype(float)
+    support = cm.sum(axis=1)
+    precision = np.divide(tp, cm.sum(axis=0), out=np.zeros(2), where=cm.sum(axis=0) > 0)
+    recall = np.divide(tp, support, out=np.zeros(2), where=support > 0)
+    f1 = np.divide(2 * precision * recall, precision + recall, out=np.zeros(2), where=(precision + recall) > 0)
+    metrics = {label: {'precision': precision[label], 'recall': recall[label], 'f1-score': f1[label],
+                       'support': int(support[label])}
+               for label in (0, 1)}
+    total = support.sum()
+    metrics['accuracy'] = tp.sum() / total if total else 0.0
+    metrics['macro avg'] = {'precision': precision.mean(), 'recall': recall.mean(), 'f1-score': f1.mean(),
+                            'support': int(total)}
+    weights = support / total if total else np.zeros(2)
+    metrics['weighted avg'] = {'precision': precision @ weights, 'recall': recall @ weights,
+                               'f1-score': f1 @ weights, 'support': int(total)}
+    return metrics
+
+def format_classification_metrics(metrics):
+    """Formats a classification_metrics() dict as the text table classification_report prints."""
+    row = '{:>12}  {:>9.2f} {:>9.2f} {:>9.2f} {:>9}'
+    lines = ['{:>12}  {:>9} {:>9} {:>9} {:>9}'.format('', 'precision', 'recall', 'f1-score', 'support'), '']
+    for label in (0, 1):
+        m = metrics[label]
+        lines.append(row.format(label, m['precision'], m['recall'], m['f1-score'], m['support']))
+    lines.append('')
+    lines.append('{:>12}  {:>9} {:>9} {:>9.2f} {:>9}'.format('accuracy', '', '', metrics['accuracy'],
+                                                            metrics['macro avg']['support']))
+    for avg in ('macro avg', 'weighted avg'):
+        m = metrics[avg]
+        lines.append(row.format(avg, m['precision'], m['recall'], m['f1-score'], m['support']))
+    return '\n'.join(lines) + '\n'
+
 def classify_and_report(y_true, y_pred, name, logger):
-    """Generates and logs a classification report."""
-    report = classification_report(y_true, y_pred, zero_division=0)
-    logger.info(f"--- {name} Classification Report ---\n{report}")
-    print(f"--- {name} Classification Report ---\n{report}")
-    return report
+    """Computes the classification metrics, logs them once as a table and returns them as a dict."""
+    metrics = classification_metrics(y_true, y_pred)
+    # The logger already echoes to the console, so the table is not printed separately
+    logger.info(f"--- {name} Classification Report ---\n{format_classification_metrics(metrics)}")
+    return metrics
 
-def generate_individual_report(df_reclassified, explainer, base_output_dir, logger, features):
+def generate_individual_report(df_recent, explainer, base_output_dir, logger, features):
     """
     Generates a detailed, patient-level report for the last 6 months.
+
+    `df_recent` holds the reclassified test rows already restricted to the
+    reporting window (RECENT_START to RECENT_END).
     """
     logger.info("--- Generating Individualized Patient Report ---")
 
-    # Filter data for the last 6 months (2024-07-01 to 2024-12-01)
-    start_date_ts = pd.Timestamp('2024-07-01')
-    end_date_ts = pd.Timestamp('2024-12-01')
-    df_reclassified['effective_month_start'] = pd.to_datetime(df_reclassified['effective_month_start'])
-    df_recent = df_reclassified[(df_reclassified['effective_month_start'] >= start_date_ts) & 
-                                (df_reclassified['effective_month_start'] <= end_date_ts)].copy()
-    
     if df_recent.empty:
         logger.warning("No data found for the latest 6 months. Skipping report generation.")
         return
+    # Sorted up front, so the SHAP matrix computed below is row-aligned with the report
+    df_recent = df_recent.sort_values(by=['fh_id', 'effective_month_start'])
 
     # Extract features for SHAP explanation
-    X_recent = df_recent[features].select_dtypes(include=['number']).fillna(0)
-
-    # Compute SHAP values for recent data
-    shap_values_recent = explainer.shap_values(X_recent)
-    
-    # Store explanations
-    shap_explanations_list = []
-    for i in range(len(X_recent)):
-        explanation = {feature: float(shap_value) for feature, shap_value in zip(features, shap_values_recent[i])}
-        shap_explanations_list.append(explanation)
-
-    df_recent['local_shap_factors'] = shap_explanations_list
+    X_recent = df_recent[features].fillna(0)
+
+    # Compute SHAP values for recent data on a row-major float32 matrix. Batches are
+    # written into one preallocated float32 result, so the explainer's working set
+    # stays at one batch of rows however long the reporting window is.
+    X_recent_values = np.ascontiguousarray(X_recent.to_numpy(), dtype=np.float32)
+    shap_values_recent = np.empty(X_recent_values.shape, dtype=np.float32)
+    for start in range(0, len(X_recent_values), SHAP_BATCH_SIZE):
+        batch = X_recent_values[start:start + SHAP_BATCH_SIZE]
+        shap_values_recent[start:start + len(batch)] = explainer.shap_values(batch)
     
-    def get_key_factors(row):
-        shap_exp = row['local_shap_factors']
-        sorted_shap = sorted(shap_exp.items(), key=lambda item: abs(item[1]), reverse=True)
-        return {feature: value for feature, value in sorted_shap[:3]}
-
-    df_recent['key_drivers'] = df_recent.apply(get_key_factors, axis=1)
-
-    report_cols = ['fh_id', 'effective_month_start', 'predicted_risk', 'risk_score', 'key_drivers', 'local_shap_factors']
-    final_report = df_recent[report_cols].sort_values(by=['fh_id', 'effective_month_start'])
-
-    report_filename = os.path.join(base_output_dir, 'individual_risk_report_latest_6_months.csv')
-    final_report.to_csv(report_filename, index=False)
+    # Top-3 drivers per row by |SHAP| (fewer when the model has under three features):
+    # argpartition picks them in O(F) per row, then only those are ordered by magnitude.
+    features_arr = np.asarray(features)
+    n_drivers = min(3, len(features_arr))
+    abs_shap = np.abs(shap_values_recent)
+    top_idx = np.argpartition(-abs_shap, n_drivers - 1, axis=1)[:, :n_drivers]
+    top_idx = np.take_along_axis(top_idx, np.argsort(-np.take_along_axis(abs_shap, top_idx, axis=1), axis=1), axis=1)
+    top_values = np.take_along_axis(shap_values_recent, top_idx, axis=1)
+
+    # The explanations are written to Parquet straight from the SHAP arrays, with no
+    # per-row Python objects. key_drivers is a map<string, float> column: row i owns
+    # the n_drivers consecutive entries from n_drivers*i of the flattened top names and
+    # values. local_shap_factors is the row's full float32 SHAP vector as a fixed-size
+    # list, in the feature order recorded in the file's 'shap_features' metadata.
+    key_drivers = pa.MapArray.from_arrays(np.arange(0, top_idx.size + 1, n_drivers, dtype=np.int32),
+                                          pa.array(features_arr[top_idx].ravel()), pa.array(top_values.ravel()))
+    local_shap_factors = pa.FixedSizeListArray.from_arrays(pa.array(shap_values_recent.ravel()),
+                                                           shap_values_recent.shape[1])
+
+    report_cols = ['fh_id', 'effective_month_start', 'predicted_risk', 'risk_score']
+    final_report = pa.Table.from_pandas(df_recent[report_cols], preserve_index=False)
+    final_report = final_report.append_column('key_drivers', key_drivers)
+    final_report = final_report.append_column('local_shap_factors', local_shap_factors)
+    final_report = final_report.replace_schema_metadata({**(final_report.schema.metadata or {}),
+                                                         b'shap_features': json.dumps(list(features)).encode()})
+
+    report_filename = os.path.join(base_output_dir, 'individual_risk_report_latest_6_months.parquet')
+    pq.write_table(final_report, report_filename, compression='snappy')
     logger.info(f"Individual patient report saved to {report_filename}")
 
-def run_pipeline(df, analysis_name, target, base_output_dir, logger):
-    """Orchestrates the entire ML pipeline for a given target variable."""
+def run_pipeline(df, analysis_name, target, base_output_dir, logger, low_risk_threshold=None):
+    """
+    Orchestrates the entire ML pipeline for a given target variable.
+
+    `low_risk_threshold` fixes the calibrated low-risk cutoff; when None it is chosen
+    automatically as the highest cutoff keeping LOW_RISK_TARGET_RECALL of the
+    validation events, so the run never waits for input.
+    """
     logger.info(f"--- Starting pipeline for target: {target} ---")
 
+    # Parse the month column once; every window filter and the report reuse it
+    if not pd.api.types.is_datetime64_any_dtype(df['effective_month_start']):
+        df = df.assign(effective_month_start=pd.to_datetime(df['effective_month_start']))
+
     # Step 1: Prepare data
     non_feature_cols = ['fh_id', 'effective_month_start', 'any_event_next_90d', 'ed_event_next_30d', 'ed_event_next_60d', 'ed_event_next_90d',
                         'ip_event_next_30d', 'ip_event_next_60d', 'ip_event_next_90d']
-    features = [col for col in df.columns if col not in non_feature_cols and df[col].dtype in ['int64', 'float64']]
+    # Every numeric column (any width, so downcast int32/float32 columns count too) except the ids and targets
+    numeric_cols = df.head(0).select_dtypes(include='number').columns
+    features = numeric_cols.drop(non_feature_cols, errors='ignore').tolist()
 
     prepared_data = prepare_data(df, target, features, logger)
     if not prepared_data:
         return
     (X_train, y_train), (X_val, y_val), (X_test, y_test), train_df, val_df, test_df = prepared_data
 
-    # Step 2: Handle class imbalance
-    X_train_resampled, y_train_resampled = apply_smote(X_train, y_train, logger)
-
-    # Step 3: Train models (only once)
-    logistic_model, best_xgb_model = train_models(X_train_resampled, y_train_resampled, logger)
+    # Step 2: Train models (only once); class imbalance is handled by class weights.
+    # Fitted models are cached under a hash of their inputs and of the model
+    # configuration, so a re-run on unchanged data and code skips training altogether.
+    model_cache_name = f"selected_{target}_{MODEL_SIGNATURE}_{training_fingerprint(X_train, y_train, X_val, y_val)}"
+    cached_models = load_model(model_cache_name)
+    if cached_models is not None:
+        logger.info(f"Reusing models cached as '{model_cache_name}'.")
+        logistic_model, best_xgb_model = cached_models
+    else:
+        logistic_model, best_xgb_model = train_models(X_train, y_train, X_val, y_val, logger)
+        save_model((logistic_model, best_xgb_model), model_cache_name)
 
     # --- ACTIONABLE OUTPUT A: Low-Risk Patient Explanation (Logistic Regression) ---
     logger.info("--- Interpreting Low-Risk Patients (Logistic Regression) ---")
@@ -193,18 +342,13 @@ def run_pipeline(df, analysis_name, target, base_output_dir, logger):
     # --- MODIFIED CODE FOR CUMULATIVE PLOT WITH CALIBRATION ---
     print("--- Analyzing Calibrated Probabilities for Low-Risk Cutoff ---")
     
-    # Declare the start and end dates as Timestamp objects once
-    start_date_ts = pd.Timestamp('2024-07-01')
-    end_date_ts = pd.Timestamp('2024-12-01')
-    
     # Calibrate the logistic model using the validation data
     calibrated_logistic_model = CalibratedClassifierCV(logistic_model, method='isotonic', cv="prefit")
     calibrated_logistic_model.fit(X_val, y_val)
 
     # Filter validation set for plotting
-    val_df['effective_month_start'] = pd.to_datetime(val_df['effective_month_start'])
-    X_val_recent = val_df[(val_df['effective_month_start'] >= start_date_ts) & (val_df['effective_month_start'] <= end_date_ts)]
-    X_val_recent = X_val_recent[features].select_dtypes(include=['number']).fillna(0).reindex(columns=X_train.columns, fill_value=0)
+    # X_val is row-aligned with val_df and already has the training columns
+    X_val_recent = X_val[val_df['effective_month_start'].between(RECENT_START, RECENT_END).to_numpy()]
     
     # Get calibrated probabilities
     calibrated_probs = calibrated_logistic_model.predict_proba(X_val_recent)[:, 1]
@@ -221,26 +365,26 @@ def run_pipeline(df, analysis_name, target, base_output_dir, logger):
     plt.grid(True)
     plt.axvline(x=0.2, color='r', linestyle='--', label='Example Cutoff (0.2)')
     plt.legend()
-    plt.show()
-
-    while True:
-        try:
-            low_risk_threshold = float(input("Based on the plot, please enter the low-risk probability threshold (e.g., 0.15): "))
-            if 0 < low_risk_threshold < 1:
-                break
-            else:
-                print("Please enter a valid number between 0 and 1.")
-        except ValueError:
-            print("Invalid input. Please enter a number.")
+    cdf_plot_path = os.path.join(base_output_dir, 'calibrated_cdf.png')
+    plt.savefig(cdf_plot_path)
+    plt.close()
+    logger.info(f"Calibrated probability CDF saved to {cdf_plot_path}")
+
+    if low_risk_threshold is None:
+        low_risk_threshold = find_low_risk_threshold(y_val, calibrated_logistic_model.predict_proba(X_val)[:, 1],
+                                                     LOW_RISK_TARGET_RECALL)
+        logger.info(f"Low-risk threshold keeping {LOW_RISK_TARGET_RECALL:.0%} validation recall: {low_risk_threshold:.4f}")
     print(f"Low-risk threshold set to: {low_risk_threshold}")
     # --- END MODIFIED CODE ---
 
-    # Step 4: Predict probabilities on validation data to optimize thresholds
-    val_probs = best_xgb_model.predict_proba(X_val.reindex(columns=X_train.columns, fill_value=0))[:, 1]
+    # Step 3: Predict probabilities on validation data to optimize thresholds.
+    # prepare_data gives every split the training columns in the same order.
+    assert X_val.columns.equals(X_train.columns) and X_test.columns.equals(X_train.columns)
+    val_probs = best_xgb_model.predict_proba(X_val)[:, 1]
     optimal_threshold = optimize_thresholds(y_val, val_probs, logger)
     
-    # Step 5: Final evaluation and reporting on the test set
-    test_probs = best_xgb_model.predict_proba(X_test.reindex(columns=X_train.columns, fill_value=0))[:, 1]
+    # Step 4: Final evaluation and reporting on the test set
+    test_probs = best_xgb_model.predict_proba(X_test)[:, 1]
     test_preds = (test_probs >= optimal_threshold).astype(int)
     
     classify_and_report(y_test, test_preds, "Test", logger)
@@ -253,25 +397,22 @@ def run_pipeline(df, analysis_name, target, base_output_dir, logger):
           "This shows which features are most important for the model's predictions overall.\n"
           f"{xgb_importances.sort_values(ascending=False).to_string()}")
 
-    # Step 6: Generate final patient report
+    # Step 5: Generate final patient report
     df_reclassified = test_df.copy()
     df_reclassified['risk_score'] = test_probs
-    df_reclassified['predicted_risk'] = ['High' if p >= optimal_threshold else 'Low' for p in test_probs]
+    df_reclassified['predicted_risk'] = pd.Categorical.from_codes((test_probs >= optimal_threshold).astype(np.int8),
+                                                                  categories=['Low', 'High'])
+
+    # The reporting window, selected once and shared by the patient report and the summary
+    df_reclassified_recent = df_reclassified[df_reclassified['effective_month_start'].between(RECENT_START, RECENT_END)]
 
     # --- ACTIONABLE OUTPUT C: Individual Patient Report ---
     explainer = shap.TreeExplainer(best_xgb_model)
-    generate_individual_report(df_reclassified, explainer, base_output_dir, logger, features)
+    generate_individual_report(df_reclassified_recent, explainer, base_output_dir, logger, features)
 
     # --- Final Summary of Key Metrics ---
     print("\n--- Final Summary for Recent Data (2024-07-01 to 2024-12-01) ---")
-    
-    # Filter the final reclassified dataframe for the summary
-    df_reclassified['effective_month_start'] = pd.to_datetime(df_reclassified['effective_month_start'])
-    
-    # Use the same Timestamp variables to filter the test set
-    df_reclassified_recent = df_reclassified[(df_reclassified['effective_month_start'] >= start_date_ts) & 
-                                             (df_reclassified['effective_month_start'] <= end_date_ts)].copy()
-                                             
+
     if not df_reclassified_recent.empty:
         total_effective_months = len(df_reclassified_recent)
         risk_counts = df_reclassified_recent['predicted_risk'].value_counts()
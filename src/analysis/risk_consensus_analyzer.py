@@ -20,21 +20,15 @@ class RiskConsensusAnalyzer:
         """
         threshold = 0.4
         # Filter for last 3 months
-        months = pd.to_datetime(self.df[self.month_col]).sort_values().unique()
+        months = self.df[self.month_col].sort_values().unique()
         last_3_months = months[-3:]
-        df_last3 = self.df[pd.to_datetime(self.df[self.month_col]).isin(last_3_months)].copy()
-        # Classify
-        lr = df_last3[self.lr_score_col]
-        xgb = df_last3[self.xgb_score_col]
-        consensus = []
-        for i in range(len(df_last3)):
-            if lr.iloc[i] < threshold and xgb.iloc[i] < threshold:
-                consensus.append('LOW')
-            elif lr.iloc[i] >= threshold and xgb.iloc[i] >= threshold:
-                consensus.append('HIGH')
-            else:
-                consensus.append('MEDIUM')
-        df_last3['RISK_CLASSIFICATION'] = consensus
+        df_last3 = self.df[self.df[self.month_col].isin(last_3_months)].copy()
+        # Classify in one vectorized pass over the two score arrays
+        lr = df_last3[self.lr_score_col].to_numpy()
+        xgb = df_last3[self.xgb_score_col].to_numpy()
+        low_mask = (lr < threshold) & (xgb < threshold)
+        high_mask = (lr >= threshold) & (xgb >= threshold)
+        df_last3['RISK_CLASSIFICATION'] = np.select([high_mask, low_mask], ['HIGH', 'LOW'], default='MEDIUM')
         # Select and sort columns
         out_cols = ['fh_id', self.month_col, 'RISK_CLASSIFICATION', self.lr_score_col, self.xgb_score_col, self.event_col]
         df_out = df_last3[out_cols].sort_values(self.month_col, ascending=False)
@@ -56,50 +50,49 @@ class RiskConsensusAnalyzer:
         month_col: column name for month
         """
         self.df = df.copy()
+        # Months are parsed once here; the per-month filters compare datetimes directly
+        self.df[month_col] = pd.to_datetime(self.df[month_col])
         self.lr_score_col = lr_score_col
         self.xgb_score_col = xgb_score_col
         self.event_col = event_col
         self.month_col = month_col
         self.thresholds = {}
 
-    def get_bins_table(self, bins=10):
-        """Return cumulative bin table for risk scores, aggregated across months."""
-        tables = {}
-        for model in [self.lr_score_col, self.xgb_score_col]:
-            self.df['bin'] = pd.cut(self.df[model], bins=bins)
-            agg = self.df.groupby('bin').agg(
-                predicted_events=(model, lambda x: np.sum(x > 0.5)),
-                actual_events=(self.event_col, 'sum'),
-                count=(model, 'count'),
-                mean_score=(model, 'mean')
-            ).reset_index()
-            tables[model] = agg
-            self.df.drop('bin', axis=1, inplace=True)
-        return tables
-
     def get_bins_table(self, bins=10):
         """Return bin table for risk scores, aggregated for the last 3 months only, with consistent bin edges."""
         tables = {}
         # Find last 3 months
-        months = pd.to_datetime(self.df[self.month_col]).sort_values().unique()
+        months = self.df[self.month_col].sort_values().unique()
         last_3_months = months[-3:]
-        df_last3 = self.df[pd.to_datetime(self.df[self.month_col]).isin(last_3_months)].copy()
+        df_last3 = self.df[self.df[self.month_col].isin(last_3_months)]  # Only read below
         # Compute common bin edges from min/max across both models
         min_score = min(df_last3[self.lr_score_col].min(), df_last3[self.xgb_score_col].min())
         max_score = max(df_last3[self.lr_score_col].max(), df_last3[self.xgb_score_col].max())
         bin_edges = np.linspace(min_score, max_score, bins + 1)
+        # The interval labels pd.cut gives these edges, so the tables read as before
+        bin_labels = pd.cut([], bins=bin_edges, include_lowest=True).categories
+        events = df_last3[self.event_col].fillna(0).to_numpy()
         for model in [self.lr_score_col, self.xgb_score_col]:
-            df_last3['bin'] = pd.cut(df_last3[model], bins=bin_edges, include_lowest=True)
-            agg = df_last3.groupby('bin').agg(
-                predicted_events=(model, 'sum'),
-                actual_events=(self.event_col, 'sum'),
-                count=(model, 'count'),
-                mean_score=(model, 'mean')
-            ).reset_index()
+            scores = df_last3[model].to_numpy()
+            valid = ~np.isnan(scores)  # Unscored rows fall in no bin, as with pd.cut
+            # Bins are right-closed like pd.cut's; the lowest edge belongs to the first bin.
+            # With the bin index known, every aggregate is one bincount over the rows.
+            bin_idx = np.clip(np.digitize(scores[valid], bin_edges, right=True) - 1, 0, bins - 1)
+            counts = np.bincount(bin_idx, minlength=bins)
+            predicted_events = np.bincount(bin_idx, weights=scores[valid], minlength=bins)
+            actual_events = np.bincount(bin_idx, weights=events[valid], minlength=bins)
+            if events.dtype.kind in 'biu':
+                actual_events = actual_events.astype(np.int64)
+            agg = pd.DataFrame({
+                'bin': pd.Categorical.from_codes(np.arange(bins), categories=bin_labels, ordered=True),
+                'predicted_events': predicted_events,
+                'actual_events': actual_events,
+                'count': counts,
+                'mean_score': np.where(counts > 0, predicted_events / np.maximum(counts, 1), np.nan)
+            })
             # Add calibration percent
             agg['calibration_percent'] = np.where(agg['predicted_events'] > 0, agg['actual_events'] / agg['predicted_events'], np.nan)
             tables[model] = agg
-            df_last3.drop('bin', axis=1, inplace=True)
         return tables
         high_thresh = thresholds[best_idx]
         low_thresh = thresholds[np.argmin(np.abs(recalls - 0.1))]  # Example: low recall ~0.1
@@ -108,21 +101,14 @@ class RiskConsensusAnalyzer:
 
     def classify_consensus(self):
         """Classify individuals by consensus between models."""
-        lr = self.df[self.lr_score_col]
-        xgb = self.df[self.xgb_score_col]
+        lr = self.df[self.lr_score_col].to_numpy()
+        xgb = self.df[self.xgb_score_col].to_numpy()
         lr_high = lr >= self.thresholds[self.lr_score_col]['high']
         lr_low = lr <= self.thresholds[self.lr_score_col]['low']
         xgb_high = xgb >= self.thresholds[self.xgb_score_col]['high']
         xgb_low = xgb <= self.thresholds[self.xgb_score_col]['low']
-        consensus = []
-        for i in range(len(self.df)):
-            if lr_high.iloc[i] and xgb_high.iloc[i]:
-                consensus.append('high_risk')
-            elif lr_low.iloc[i] and xgb_low.iloc[i]:
-                consensus.append('low_risk')
-            else:
-                consensus.append('medium_risk')
-        self.df['consensus_risk'] = consensus
+        self.df['consensus_risk'] = np.select([lr_high & xgb_high, lr_low & xgb_low],
+                                              ['high_risk', 'low_risk'], default='medium_risk')
         return self.df
 
     def run_full_analysis(self, bins=10):
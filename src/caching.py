@@ -1,4 +1,5 @@
 import os
+import joblib
 import pandas as pd
 from datetime import datetime, timedelta
 
@@ -12,16 +13,18 @@ def _get_cache_filepath(query_name: str) -> str:
         os.makedirs(CACHE_DIR)
     return os.path.join(CACHE_DIR, f"{query_name}.parquet")
 
-def is_cache_valid(query_name: str, force_refresh: bool = False) -> bool:
+def is_cache_valid(query_name: str, force_refresh: bool = False, use_cache: bool = True) -> bool:
     """
     Checks if a valid, non-stale cache file exists for a given query.
 
     Args:
         query_name: A unique name for the query (e.g., 'events_data').
         force_refresh (bool): If True, invalidates the cache and forces a refresh.
+        use_cache (bool): Whether a valid cache should be used. Batch runs pass this
+                          from their CLI/config; None asks the user interactively.
 
     Returns:
-        True if a valid cache file exists, False otherwise.
+        True if a valid cache file exists and should be used, False otherwise.
     """
     if force_refresh:
         print("User requested a force refresh.")
@@ -37,6 +40,10 @@ def is_cache_valid(query_name: str, force_refresh: bool = False) -> bool:
         print(f"Cache is stale (older than {CACHE_EXPIRATION_HOURS} hours).")
         return False
 
+    if use_cache is not None:
+        print("Using cached data." if use_cache else "Cache use disabled; refreshing data from source.")
+        return use_cache
+
     # Ask user if they want to use the cache
     while True:
         try:
@@ -53,19 +60,21 @@ def is_cache_valid(query_name: str, force_refresh: bool = False) -> bool:
             print("No user input detected, defaulting to using cache.")
             return True
 
-def load_from_cache(query_name: str) -> pd.DataFrame:
+def load_from_cache(query_name: str, columns: list = None) -> pd.DataFrame:
     """
     Loads data from a Parquet cache file.
 
     Args:
         query_name: The unique name for the query.
+        columns: Optional list of columns to read; only these are read from disk.
 
     Returns:
         A pandas DataFrame with the cached data.
     """
     cache_path = _get_cache_filepath(query_name)
     print(f"Loading data from cache: {cache_path}")
-    return pd.read_parquet(cache_path)
+    # The file is memory-mapped, so pyarrow reads the pages it needs without an extra buffer copy
+    return pd.read_parquet(cache_path, engine='pyarrow', columns=columns, memory_map=True)
 
 def save_to_cache(df: pd.DataFrame, query_name: str):
     """
@@ -77,4 +86,42 @@ def save_to_cache(df: pd.DataFrame, query_name: str):
     """
     cache_path = _get_cache_filepath(query_name)
     print(f"Saving data to cache: {cache_path}")
-    df.to_parquet(cache_path, index=False)
+    df.to_parquet(cache_path, engine='pyarrow', compression='snappy', index=False, use_dictionary=True)
+
+def _get_model_filepath(model_name: str) -> str:
+    """Constructs the full path for a given model cache file."""
+    model_dir = os.path.join(CACHE_DIR, "models")
+    if not os.path.exists(model_dir):
+        os.makedirs(model_dir)
+    return os.path.join(model_dir, f"{model_name}.joblib")
+
+def load_model(model_name: str):
+    """
+    Loads a fitted model (or any picklable object) from the model cache.
+
+    Model names are expected to embed a fingerprint of the training data, so a
+    cached model never goes stale and no expiry check is made.
+
+    Args:
+        model_name: The unique name for the model, including its data fingerprint.
+
+    Returns:
+        The cached object, or None if there is no cache file for this name.
+    """
+    model_path = _get_model_filepath(model_name)
+    if not os.path.exists(model_path):
+        return None
+    print(f"Loading model from cache: {model_path}")
+    return joblib.load(model_path)
+
+def save_model(obj, model_name: str):
+    """
+    Saves a fitted model (or any picklable object) to the model cache.
+
+    Args:
+        obj: The object to save.
+        model_name: The unique name for the model, including its data fingerprint.
+    """
+    model_path = _get_model_filepath(model_name)
+    print(f"Saving model to cache: {model_path}")
+    joblib.dump(obj, model_path, compress=3)
@@ -156,4 +156,9 @@ DEFAULT_CONFIG = {
     ]
 }
 
+# Normalized (stripped, upper-cased) exclusion set and target, computed once at import
+# so feature selection does not re-normalize the exclusion list on every call
+EXCLUDE_NORM = frozenset(e.strip().upper() for e in DEFAULT_CONFIG['EXCLUDE_FEATURES'])
+TARGET_NORM = DEFAULT_CONFIG['TARGET'].strip().upper()
+
 # CLI overrides will update DEFAULT_CONFIG at runtime via argparse in updated_seperate_regression_models.py
\ No newline at end of file
@@ -9,25 +9,22 @@ def select_features(df: pd.DataFrame, exclude: list, logger: logging.Logger) ->
     """
     Returns list of numeric features not in exclude, and list of skipped features (non-numeric or missing).
     """
-    features = []
-    skipped = []
     # Get target from config if available
     import src.config
-    target = getattr(src.config, 'DEFAULT_CONFIG', {}).get('TARGET', None)
-    # Normalize exclude list for case and whitespace
-    exclude_norm = set(e.strip().upper() for e in exclude)
-    target_norm = target.strip().upper() if target else None
-    for col in df.columns:
-        col_norm = col.strip().upper()
-        # Exclude target and excluded features (case-insensitive, strip whitespace)
-        if col_norm == target_norm:
-            continue
-        if col_norm in exclude_norm:
-            continue
-        # Only include numeric columns
-        if pd.api.types.is_numeric_dtype(df[col]):
-            features.append(col)
-        else:
-            skipped.append(col)
-            logger.warning(f"Skipping non-numeric feature: {col}")
+    target_norm = src.config.TARGET_NORM
+    # Normalize exclude list and column names for case and whitespace; the default
+    # exclude list is already normalized in config
+    if exclude is src.config.DEFAULT_CONFIG['EXCLUDE_FEATURES']:
+        exclude_norm = src.config.EXCLUDE_NORM
+    else:
+        exclude_norm = frozenset(e.strip().upper() for e in exclude)
+    columns_norm = df.columns.str.strip().str.upper()
+    # Exclude target and excluded features (case-insensitive, strip whitespace)
+    candidate_mask = ~columns_norm.isin(exclude_norm) & (columns_norm != target_norm)
+    # Only include numeric columns; dtypes are read from an empty slice so no data is copied
+    numeric_mask = df.columns.isin(df.head(0).select_dtypes(include=['number', 'bool']).columns)
+    features = df.columns[candidate_mask & numeric_mask].tolist()
+    skipped = df.columns[candidate_mask & ~numeric_mask].tolist()
+    if skipped:
+        logger.warning(f"Skipping {len(skipped)} non-numeric feature(s): {', '.join(skipped)}")
     return features, skipped
@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 # splitter.py
 # Member-level train/val/test split logic for Risk Grouper Refactor
@@ -27,10 +28,18 @@ def member_level_split(
     """
     Splits df into train/val/test at member (fh_id) level, returns dict of splits.
     """
-    unique_members = df['FH_ID'].unique()
-    train_members, test_members = train_test_split(unique_members, test_size=test_size, random_state=seed)
+    # Members are encoded to integer codes once (missing ids form their own member, as
+    # with unique()), the split is drawn over the codes, and each row's split is then a
+    # single array lookup instead of three isin scans over the ids.
+    member_codes, unique_members = pd.factorize(df['FH_ID'], use_na_sentinel=False)
+    train_members, test_members = train_test_split(np.arange(len(unique_members)), test_size=test_size, random_state=seed)
     train_members, val_members = train_test_split(train_members, test_size=val_size, random_state=seed)
-    train_df = df[df['FH_ID'].isin(train_members)].copy().dropna(subset=[target])
-    val_df = df[df['FH_ID'].isin(val_members)].copy().dropna(subset=[target])
-    test_df = df[df['FH_ID'].isin(test_members)].copy().dropna(subset=[target])
+    member_split = np.empty(len(unique_members), dtype=np.int8)
+    member_split[train_members], member_split[val_members], member_split[test_members] = 0, 1, 2
+    row_split = member_split[member_codes]
+    has_target = df[target].notna().to_numpy()
+    # take() makes the only copy of each split
+    train_df = df.take(np.flatnonzero((row_split == 0) & has_target))
+    val_df = df.take(np.flatnonzero((row_split == 1) & has_target))
+    test_df = df.take(np.flatnonzero((row_split == 2) & has_target))
     return {'train': train_df, 'val': val_df, 'test': test_df}
@@ -25,11 +25,13 @@ def train_logistic(train_data: pd.DataFrame, features: list, config) -> Logistic
     # Extract hyperparameters from config or use defaults
     from sklearn.pipeline import Pipeline
     from sklearn.preprocessing import StandardScaler
-    # Define pipeline with scaling and logistic regression
+    # Define pipeline with scaling and logistic regression. The features arrive as a
+    # dense block, where lbfgs reaches the same tolerance in far fewer passes than saga;
+    # saga only pays off on sparse matrices.
     pipe = Pipeline(steps=[
         ("scale", StandardScaler(with_mean=False)),
         ("logreg", LogisticRegression(
-            solver="saga",
+            solver="lbfgs",
             penalty="l2",
             class_weight="balanced",
             C=1.0,
@@ -40,7 +42,14 @@ def train_logistic(train_data: pd.DataFrame, features: list, config) -> Logistic
         ))
     ])
 
-    X = train_data[features].fillna(0)
+    # Fill NaNs while converting to a single float32 block, so every solver pass reads
+    # half the bytes of the float64 frame
+    X = pd.DataFrame(
+        train_data[features].to_numpy(dtype=np.float32, na_value=0),
+        columns=features,
+        index=train_data.index,
+        copy=False,
+    )
     y = train_data[config['TARGET']]
 
     pipe.fit(X, y)
@@ -16,7 +16,7 @@ def train_xgboost(train_data: pd.DataFrame, features: list, config) -> xgb.XGBCl
         Trained XGBClassifier model
     """
     import numpy as np
-    from sklearn.model_selection import RandomizedSearchCV
+    from sklearn.model_selection import ParameterSampler
     from scipy.stats import randint, uniform
 
     # Set random seed for reproducibility
@@ -26,7 +26,14 @@ def train_xgboost(train_data: pd.DataFrame, features: list, config) -> xgb.XGBCl
     # Extract hyperparameters from config or use defaults
     xgb_params = getattr(config, 'xgboost_params', {})
 
-    X = train_data[features]
+    # XGBoost bins float32 internally, so hand it one C-contiguous float32 block; this
+    # halves the bytes copied into the DMatrix. NaNs are kept as missing values.
+    X = pd.DataFrame(
+        np.ascontiguousarray(train_data[features].to_numpy(dtype=np.float32)),
+        columns=features,
+        index=train_data.index,
+        copy=False,
+    )
     y = train_data[config['TARGET']]
 
     # Calculate scale_pos_weight for class imbalance using resampled data
@@ -36,9 +43,9 @@ def train_xgboost(train_data: pd.DataFrame, features: list, config) -> xgb.XGBCl
     xgb_params['scale_pos_weight'] = scale_pos_weight
     print(f"XGBoost scale_pos_weight set to: {scale_pos_weight} (neg: {n_neg}, pos: {n_pos})")
 
-    # Define parameter grid for RandomizedSearchCV
+    # Define parameter distributions for the random search. The number of trees is not
+    # sampled: each candidate's cross-validation stops once its AUC stops improving.
     param_dist = {
-        'n_estimators': randint(50, 300),
         'max_depth': randint(3, 10),
         'learning_rate': uniform(0.01, 0.3),
         'subsample': uniform(0.6, 0.4),
@@ -46,20 +53,32 @@ def train_xgboost(train_data: pd.DataFrame, features: list, config) -> xgb.XGBCl
         'gamma': uniform(0, 0.5),
         'reg_alpha': uniform(0, 1),
         'reg_lambda': uniform(0, 1),
-        'scale_pos_weight': [scale_pos_weight],
     }
+    max_estimators = 300
 
-    base_model = xgb.XGBClassifier(random_state=seed, **{k: v for k, v in xgb_params.items() if k != 'scale_pos_weight'})
-    search = RandomizedSearchCV(
-        base_model,
-        param_distributions=param_dist,
-        n_iter=20,
-        scoring='roc_auc',
-        cv=3,
-        verbose=1,
-        n_jobs=-1,
-        random_state=seed,
-    )
-    search.fit(X, y)
-    print(f"Best XGBoost params: {search.best_params_}")
-    return search.best_estimator_
+    # Score every candidate with xgb.cv on one DMatrix built up front, rather than
+    # RandomizedSearchCV rebuilding a DMatrix for each fold of each candidate.
+    base_params = {**xgb_params, 'objective': 'binary:logistic', 'eval_metric': 'auc', 'seed': seed}
+    dtrain = xgb.DMatrix(X, label=y)
+    best_auc, best_params, best_n_estimators = -np.inf, None, None
+    for candidate in ParameterSampler(param_dist, n_iter=20, random_state=seed):
+        cv_result = xgb.cv(
+            {**base_params, **candidate},
+            dtrain,
+            num_boost_round=max_estimators,
+            nfold=3,
+            stratified=True,
+            early_stopping_rounds=10,
+            seed=seed,
+        )
+        # With early stopping the last row is the best round
+        mean_auc = cv_result['test-auc-mean'].iloc[-1]
+        if mean_auc > best_auc:
+            best_auc, best_params, best_n_estimators = mean_auc, candidate, len(cv_result)
+    del dtrain
+
+    best_params = {**xgb_params, **best_params, 'n_estimators': best_n_estimators}
+    print(f"Best XGBoost params: {best_params} (CV AUC: {best_auc:.4f})")
+    model = xgb.XGBClassifier(random_state=seed, **best_params)
+    model.fit(X, y)
+    return model
@@ -4,6 +4,7 @@
 import pandas as pd
 import json
 from typing import Dict, Any
+from src.reporting.writers import write_frame_csv
 
 def write_consolidated_individuals(
     df: pd.DataFrame,
@@ -73,7 +74,7 @@ def write_consolidated_individuals(
             'xgboost.base_value': xgb_base_value
         })
     out_df = pd.DataFrame(rows)
-    out_df.to_csv(output_path, index=False)
+    write_frame_csv(out_df, output_path)
     print(f"Individual predictions and SHAP factors written to {output_path}")
     
 def write_full_consolidated_individuals(
@@ -171,5 +172,5 @@ def write_full_consolidated_individuals(
         })
     out_df = pd.DataFrame(rows)
     output_path = cfg.get('FULL_INDIVIDUAL_OUTPUT_PATH', 'output/individual_full_consolidated.csv')
-    out_df.to_csv(output_path, index=False)
+    write_frame_csv(out_df, output_path)
     print(f"Full consolidated individual file written to {output_path}")
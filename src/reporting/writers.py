@@ -1,6 +1,7 @@
 # Explicitly export all writer functions
 __all__ = [
     'write_csv',
+    'write_frame_csv',
     'write_json',
     'save_confusion_matrix',
     'write_metrics',
@@ -10,15 +11,27 @@ __all__ = [
 # CSV/JSON writers and confusion matrix image generation for Risk Grouper Refactor
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
 import json
 import os
-import matplotlib.pyplot as plt
-import seaborn as sns
 from typing import List, Dict
 
 def write_csv(data: List[Dict], path: str):
-    df = pd.DataFrame(data)
-    df.to_csv(path, index=False)
+    write_frame_csv(pd.DataFrame(data), path)
+
+def write_frame_csv(df: pd.DataFrame, path: str):
+    """
+    Write a DataFrame to CSV with pyarrow's multi-threaded writer instead of pandas'
+    single-threaded to_csv. Frames Arrow cannot type (e.g. object columns of mixed
+    types) or cannot write as CSV (e.g. dict or list cells, which become struct or
+    list columns) fall back to pandas.
+    """
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        pa_csv.write_csv(table, path, pa_csv.WriteOptions(quoting_style='needed'))
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        df.to_csv(path, index=False)
 
 def write_json(data: List[Dict], path: str):
     with open(path, "w") as f:
@@ -48,7 +61,7 @@ def write_metrics(metrics_logistic, metrics_xgb, config):
                     row = {'model': model, 'split': split_name}
                     row.update(split_metrics)
                     rows.append(row)
-    pd.DataFrame(rows).to_csv('output/metrics/metrics.csv', index=False)
+    write_frame_csv(pd.DataFrame(rows), 'output/metrics/metrics.csv')
 
 def write_confusion_matrix(metrics_logistic, metrics_xgb, config):
     """
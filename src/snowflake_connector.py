@@ -201,6 +201,31 @@ class SnowflakeConnector:
             print(f"Error streaming query to DataFrame: {e}")
             return
 
+    def query_to_arrow(self, query):
+        """
+        Executes a SQL query and fetches the whole result as a single Arrow table.
+
+        The result batches are assembled by the connector directly in Arrow memory,
+        so no intermediate list of pandas chunks is built.
+
+        Args:
+            query (str): The SQL query to execute.
+
+        Returns:
+            pyarrow.Table or None: The query result, or None if the query returned
+                                   no rows, failed, or there is no connection.
+        """
+        if not self.cursor:
+            print("No active connection. Please connect first.")
+            return None
+
+        try:
+            self.cursor.execute(query)
+            return self.cursor.fetch_arrow_all()
+        except Exception as e:
+            print(f"Error fetching query as Arrow table: {e}")
+            return None
+
     def get_tables(self):
         """
         Retrieves a list of tables in the current database and schema.
@@ -240,7 +265,11 @@ class SnowflakeConnector:
         self.connect()
         return self
 
-
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """
+        Context manager exit point. Closes the connection when the `with` block
+        ends, whether it completed normally or raised.
+        """
         self.close()
 
 # --- Pipeline Integration Helper ---
@@ -1,16 +1,36 @@
 import pandas as pd
+import pyarrow.parquet as pq
 import os
 
 # Path to cached claims dataset
 claims_path = "cache/claims_only_dataset.parquet"
 
-# Load the claims dataset
+# The only columns the yearly summary uses; the rest of the (wide) dataset is never read
+summary_columns = [
+    'EVENT_DATE', 'MEMBER_ID',
+    'CNT_IP_VISITS_90D', 'CNT_IP_VISITS_180D', 'CNT_ED_VISITS_90D', 'CNT_ED_VISITS_180D',
+    'PAID_SUM_90D', 'PAID_SUM_180D',
+    'NOTE_HEALTH_SCORE', 'NOTE_RISK_HARM_SCORE', 'NOTE_SOCIAL_STAB_SCORE', 'NOTE_MED_ADHERENCE_SCORE',
+    'NOTE_CARE_ENGAGEMENT_SCORE', 'NOTE_PROGRAM_TRUST_SCORE', 'NOTE_SELF_SCORE',
+    'CNT_HCC_DIABETES_90D', 'CNT_HCC_DIABETES_180D', 'CNT_HCC_MENTAL_HEALTH_90D', 'CNT_HCC_MENTAL_HEALTH_180D',
+    'CNT_HCC_CARDIOVASCULAR_90D', 'CNT_HCC_CARDIOVASCULAR_180D', 'CNT_HCC_PULMONARY_90D', 'CNT_HCC_PULMONARY_180D',
+    'CNT_HCC_KIDNEY_90D', 'CNT_HCC_KIDNEY_180D', 'CNT_HCC_SUD_90D', 'CNT_HCC_SUD_180D',
+    'CNT_ANY_HCC_90D', 'CNT_ANY_HCC_180D',
+    'CNT_PROC_PSYCHOTHERAPY_90D', 'CNT_PROC_PSYCHOTHERAPY_180D', 'CNT_PROC_PSYCHIATRIC_EVALS_90D', 'CNT_PROC_PSYCHIATRIC_EVALS_180D',
+    'CNT_FILLS_ANTIPSYCHOTIC_90D', 'CNT_FILLS_ANTIPSYCHOTIC_180D', 'CNT_FILLS_INSULIN_90D', 'CNT_FILLS_INSULIN_180D',
+    'CNT_FILLS_ORAL_ANTIDIAB_90D', 'CNT_FILLS_ORAL_ANTIDIAB_180D', 'CNT_FILLS_STATIN_90D', 'CNT_FILLS_STATIN_180D',
+    'CNT_FILLS_BETA_BLOCKER_90D', 'CNT_FILLS_BETA_BLOCKER_180D', 'CNT_FILLS_OPIOID_90D', 'CNT_FILLS_OPIOID_180D',
+    'NOTE_HEALTH_DELTA_30D', 'NOTE_RISK_HARM_DELTA_30D', 'NOTE_SOCIAL_STAB_DELTA_30D', 'NOTE_MED_ADHERENCE_DELTA_30D',
+    'NOTE_CARE_ENGAGEMENT_DELTA_30D',
+]
+
+# Load the claims dataset, reading only the summarised columns
 print(f"Loading claims data from {claims_path} ...")
-df = pd.read_parquet(claims_path)
+df = pd.read_parquet(claims_path, engine='pyarrow', columns=summary_columns)
 print(f"Loaded {len(df):,} rows.")
 
-# Check for expected columns
-print("Columns:", df.columns.tolist())
+# Check for expected columns (the full list is read from the file footer, not the data)
+print("Columns:", pq.read_schema(claims_path).names)
 
 
 # Extract year from EVENT_DATE, coerce errors (invalid dates become NaT)
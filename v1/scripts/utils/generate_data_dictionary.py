@@ -1,7 +1,11 @@
+import hashlib
+import mmap
 import os
+import pickle
 import re
 import pandas as pd
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # Add src directory to the Python path
@@ -11,6 +15,17 @@ sys.path.append(str(src_path))
 
 from snowflake_connector import SnowflakeConnector
 
+# Compiled once at import; parse_sql_for_tables runs them against every SQL file.
+# Byte patterns so they can scan a memory-mapped file without decoding it first.
+SET_VARIABLE_PATTERN = re.compile(rb"SET\s+(\w+)\s*=\s*'([^']+)';", re.IGNORECASE)
+TABLE_REFERENCE_PATTERN = re.compile(rb'(?:FROM|JOIN|INTO)\s+(?:IDENTIFIER\s*\(\s*\$(\w+)\s*\)|([\w\._]+))', re.IGNORECASE)
+
+# Number of schema queries kept in flight against Snowflake at once.
+SCHEMA_FETCH_WORKERS = 16
+
+# Fetched schemas are cached here, keyed by a hash of the SQL files they were found in.
+CACHE_DIR = "cache"
+
 def find_sql_files(directory):
     """Finds all SQL files in a given directory."""
     sql_files = []
@@ -21,25 +36,34 @@ def find_sql_files(directory):
     return sql_files
 
 def parse_sql_for_tables(file_content):
-    """Parses SQL content to find table names, resolving variables."""
-    # Find all SET variable assignments
-    variables = dict(re.findall(r"SET\s+(\w+)\s*=\s*'([^']+)';", file_content, re.IGNORECASE))
+    """Parses SQL content (bytes or a memory map) to find table names, resolving variables."""
+    # Find all SET variable assignments; only the matched pieces are decoded
+    variables = {var.decode(): value.decode() for var, value in SET_VARIABLE_PATTERN.findall(file_content)}
     
     # Find all tables referenced directly or via IDENTIFIER()
-    raw_tables = re.findall(r'(?:FROM|JOIN|INTO)\s+(?:IDENTIFIER\s*\(\s*\$(\w+)\s*\)|([\w\._]+))', file_content, re.IGNORECASE)
+    raw_tables = TABLE_REFERENCE_PATTERN.findall(file_content)
     
     tables = set()
     for var, direct in raw_tables:
         if var: # If it's a variable from IDENTIFIER($VAR)
-            table_name = variables.get(var.upper())
+            table_name = variables.get(var.decode().upper())
             if table_name:
                 tables.add(table_name.upper())
         elif direct: # If it's a direct table name
             # Exclude CTEs that might be captured
-            if '.' in direct: # A simple check for FQNs vs CTEs
-                 tables.add(direct.upper())
+            if b'.' in direct: # A simple check for FQNs vs CTEs
+                 tables.add(direct.decode().upper())
     return tables
 
+def scan_sql_file(sql_file, hasher=None):
+    """Memory-maps a SQL file and returns the tables it references, feeding its bytes to `hasher` if given."""
+    if os.path.getsize(sql_file) == 0:
+        return set()  # mmap cannot map an empty file
+    with open(sql_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if hasher is not None:
+            hasher.update(mm)
+        return parse_sql_for_tables(mm)
+
 def get_table_schema(connector, table_name):
     """Fetches the schema for a given table from Snowflake."""
     print(f"Fetching schema for table: {table_name}")
@@ -51,6 +75,90 @@ def get_table_schema(connector, table_name):
         print(f"Could not fetch schema for {table_name}: {e}")
         return None
 
+def describe_type(data_type, precision, scale, max_length, datetime_precision):
+    """Rebuilds the DESCRIBE TABLE type string (e.g. NUMBER(38,0), VARCHAR(16777216)) from INFORMATION_SCHEMA fields."""
+    if data_type == 'NUMBER' and pd.notna(precision):
+        return f"NUMBER({int(precision)},{int(scale) if pd.notna(scale) else 0})"
+    if data_type in ('TEXT', 'BINARY') and pd.notna(max_length):
+        return f"{'VARCHAR' if data_type == 'TEXT' else 'BINARY'}({int(max_length)})"
+    if (data_type == 'TIME' or data_type.startswith('TIMESTAMP')) and pd.notna(datetime_precision):
+        return f"{data_type}({int(datetime_precision)})"
+    return data_type
+
+def get_database_schemas(connector, database, table_names):
+    """Fetches the schemas for several tables in one database with a single INFORMATION_SCHEMA query."""
+    print(f"Fetching schemas for {len(table_names)} tables in database: {database}")
+    keys = [tuple(name.split('.')) for name in table_names]
+    in_list = ", ".join(f"('{db}', '{schema}', '{table}')" for db, schema, table in keys)
+    query = f"""
+        SELECT table_catalog, table_schema, table_name,
+               column_name AS name, data_type, numeric_precision, numeric_scale,
+               character_maximum_length, datetime_precision, comment
+        FROM {database}.INFORMATION_SCHEMA.COLUMNS
+        WHERE (table_catalog, table_schema, table_name) IN ({in_list})
+        ORDER BY table_catalog, table_schema, table_name, ordinal_position
+    """
+    columns_df = connector.query_to_dataframe(query)
+    if columns_df is None:
+        print(f"Could not fetch schemas for database {database}")
+        return {}
+    # Snowflake returns upper-case column labels; match the DESCRIBE output used downstream
+    columns_df.columns = columns_df.columns.str.lower()
+    columns_df['type'] = [describe_type(*column) for column in zip(
+        columns_df['data_type'], columns_df['numeric_precision'], columns_df['numeric_scale'],
+        columns_df['character_maximum_length'], columns_df['datetime_precision'])]
+    return {
+        '.'.join(key): group
+        for key, group in columns_df.groupby(['table_catalog', 'table_schema', 'table_name'], sort=False)
+    }
+
+def _get_cache_filepath(signature):
+    """Constructs the path of the schema cache for a given SQL signature."""
+    # v2: INFORMATION_SCHEMA types rebuilt in DESCRIBE form; older caches hold bare types
+    return os.path.join(CACHE_DIR, f"data_dict_v2_{signature}.pkl")
+
+def load_cached_schemas(signature):
+    """Returns the cached {table: schema_df} for this SQL signature, or None if there is none."""
+    cache_path = _get_cache_filepath(signature)
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        with open(cache_path, 'rb') as f:
+            return pickle.load(f)
+    except Exception as e:
+        print(f"Could not read schema cache {cache_path}: {e}")
+        return None
+
+def save_cached_schemas(signature, schemas):
+    """Saves {table: schema_df} under this SQL signature."""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(_get_cache_filepath(signature), 'wb') as f:
+        pickle.dump(schemas, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+def fetch_schemas(tables):
+    """Fetches {table: schema_df} for the given sorted table names from Snowflake."""
+    # Fully qualified names are looked up per database in one query; anything else
+    # (e.g. an unqualified name) falls back to an individual DESCRIBE.
+    tables_by_database = {}
+    unqualified_tables = []
+    for table in tables:
+        if table.count('.') == 2:
+            tables_by_database.setdefault(table.split('.')[0], []).append(table)
+        else:
+            unqualified_tables.append(table)
+
+    schemas = {}
+    with SnowflakeConnector() as sf:
+        with ThreadPoolExecutor(max_workers=SCHEMA_FETCH_WORKERS) as pool:
+            database_jobs = [pool.submit(get_database_schemas, sf, database, names)
+                             for database, names in tables_by_database.items()]
+            table_jobs = {table: pool.submit(get_table_schema, sf, table) for table in unqualified_tables}
+            for job in database_jobs:
+                schemas.update(job.result())
+            for table, job in table_jobs.items():
+                schemas[table] = job.result()
+    return schemas
+
 def main():
     """Main function to generate the data dictionary."""
     sql_dir = 'scripts/sql'
@@ -67,21 +175,33 @@ def main():
         print(f"No SQL files found in '{sql_dir}'. Exiting.")
         return
 
+    # The hash of every SQL file (in a stable order) keys the schema cache, so any
+    # edit to the SQL invalidates it automatically.
+    hasher = hashlib.blake2b()
     all_tables = set()
-    for sql_file in all_sql_files:
-        with open(sql_file, 'r') as f:
-            content = f.read()
-            tables_in_file = parse_sql_for_tables(content)
-            all_tables.update(tables_in_file)
+    for sql_file in sorted(all_sql_files):
+        hasher.update(sql_file.encode())
+        all_tables.update(scan_sql_file(sql_file, hasher))
+    signature = hasher.hexdigest()
 
     print(f"Found {len(all_tables)} unique tables to document.")
 
-    with SnowflakeConnector() as sf, open(output_file, 'w') as f:
+    tables = sorted(all_tables)
+    schemas = load_cached_schemas(signature)
+    if schemas is not None:
+        print(f"Using cached schemas for SQL signature {signature[:12]}.")
+    else:
+        schemas = fetch_schemas(tables)
+        # Only cache a complete result so a failed lookup is retried next run
+        if all(schemas.get(table) is not None for table in tables):
+            save_cached_schemas(signature, schemas)
+
+    with open(output_file, 'w') as f:
         f.write("# Data Dictionary\n\n")
         f.write("This document contains the schema for all tables used in the SQL scripts.\n\n")
         
-        for table in sorted(list(all_tables)):
-            schema = get_table_schema(sf, table)
+        for table in tables:
+            schema = schemas.get(table)
             if schema is not None and not schema.empty:
                 f.write(f"## ` {table} `\n\n")
                 # Select and rename columns for clarity
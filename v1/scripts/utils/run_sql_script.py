@@ -7,8 +7,110 @@ if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
 import argparse
+from itertools import groupby
 from src.snowflake_connector import SnowflakeConnector
+from sql_splitter import split_sql_statements
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+def unify_batch_schema(schema):
+    """
+    Widens every integer column of an Arrow schema to int64.
+
+    Snowflake sends NUMBER(p,0) columns in whatever integer width fits each result
+    chunk, so one column can arrive as int8 in one batch and int16 in the next.
+
+    Args:
+        schema (pyarrow.Schema): The schema of the first result batch.
+
+    Returns:
+        pyarrow.Schema: A schema every later batch of the result can be cast to.
+    """
+    return pa.schema([field.with_type(pa.int64()) if pa.types.is_integer(field.type) else field
+                      for field in schema], metadata=schema.metadata)
+
+def write_result_batches(cursor, output_path):
+    """
+    Streams the current result set of `cursor` to a file one Arrow batch at a time,
+    so the full result is never held in memory as a DataFrame.
+
+    Batches are cast to one schema before they are written: timestamps are fetched
+    at microsecond precision and integer columns are widened to int64. If the
+    export fails partway through, the partial file is removed.
+
+    Args:
+        cursor: A Snowflake cursor holding the result of an executed query.
+        output_path (str): Destination file; `.parquet` writes zstd Parquet,
+                           anything else writes CSV.
+
+    Returns:
+        int: The number of rows written. The file is only created once a
+             non-empty batch arrives, so nothing is written for an empty result.
+    """
+    writer = None
+    schema = None
+    rows_written = 0
+    try:
+        for batch in cursor.fetch_arrow_batches(force_microsecond_precision=True):
+            if batch.num_rows == 0:
+                continue
+            if writer is None:
+                schema = unify_batch_schema(batch.schema)
+                if output_path.endswith('.parquet'):
+                    writer = pq.ParquetWriter(output_path, schema, compression='zstd')
+                else:
+                    writer = pa_csv.CSVWriter(output_path, schema)
+            writer.write_table(batch.cast(schema))
+            rows_written += batch.num_rows
+    except Exception:
+        if writer is not None:
+            writer.close()
+            writer = None
+            os.remove(output_path)
+        raise
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows_written
+
+def run_selects_async(sf, statements, output_path=None):
+    """
+    Submits a run of SELECT statements without waiting on each one, then
+    collects their results in submission order.
+
+    SELECTs do not depend on one another, so Snowflake can compile and execute
+    them concurrently; the run costs roughly its slowest query instead of the sum.
+
+    Args:
+        sf (SnowflakeConnector): A connected SnowflakeConnector.
+        statements (list[str]): The SELECT statements to run.
+        output_path (str, optional): If given, the result of the last statement is
+                                     streamed to this file instead of being returned.
+
+    Returns:
+        list: One result DataFrame per statement; for a streamed statement, the
+              number of rows written instead.
+    """
+    cursor = sf.connection.cursor()
+    try:
+        query_ids = []
+        for statement in statements:
+            cursor.execute_async(statement)
+            query_ids.append(cursor.sfqid)
+
+        results = []
+        for n, query_id in enumerate(query_ids, start=1):
+            # Blocks until that query finishes, raising if it failed
+            cursor.get_results_from_sfqid(query_id)
+            if output_path and n == len(query_ids):
+                results.append(write_result_batches(cursor, output_path))
+            else:
+                results.append(cursor.fetch_pandas_all())
+        return results
+    finally:
+        cursor.close()
 
 def run_sql_from_file(filepath, output_path=None):
     """
@@ -17,7 +119,8 @@ def run_sql_from_file(filepath, output_path=None):
 
     Args:
         filepath (str): The full path to the .sql file.
-        output_path (str, optional): The path to save the final query result as a CSV.
+        output_path (str, optional): The path to save the result of the last SELECT
+                                     statement to, as Parquet (`.parquet`) or CSV.
     """
     # 1. Check if the file exists
     if not os.path.exists(filepath):
@@ -32,9 +135,10 @@ def run_sql_from_file(filepath, output_path=None):
         print(f"Error reading SQL file: {e}")
         return
 
-    # 3. Split the script into individual statements, handling semicolons
-    #    and removing empty statements that result from splitting.
-    statements = [stmt.strip() for stmt in sql_script.split(';') if stmt.strip()]
+    # 3. Split the script into individual statements. Semicolons inside literals,
+    #    quoted identifiers, $$ blocks and comments are respected, comments are
+    #    dropped and empty statements are skipped.
+    statements = split_sql_statements(sql_script)
 
     if not statements:
         print("No SQL statements found in the file.")
@@ -48,54 +152,49 @@ def run_sql_from_file(filepath, output_path=None):
 
         print(f"Successfully connected to Snowflake. Executing {len(statements)} statements from '{os.path.basename(filepath)}'...")
 
-        final_df = None  # To store the result of the last SELECT statement
+        numbered = list(enumerate(statements, start=1))
+        is_select = lambda item: item[1].upper().startswith('SELECT')
+        # The last SELECT's result is streamed straight to output_path
+        last_select = max((item[0] for item in numbered if is_select(item)), default=None)
+        if output_path:
+            # Create directory if it doesn't exist
+            output_dir = os.path.dirname(output_path)
+            if output_dir:
+                os.makedirs(output_dir, exist_ok=True)
+
+        # Statements run in script order, one run of consecutive statements of the
+        # same kind at a time. Comments were stripped by the splitter, so the type
+        # (e.g., SELECT vs. SET) can be read straight off the first keyword.
+        # - SET, CREATE, etc. may depend on each other, so a run of them is shipped
+        #   in a single execute_string call that executes them in order.
+        # - SELECTs are independent, so a run of them is submitted asynchronously.
+        for run_is_select, run in groupby(numbered, key=is_select):
+            run = list(run)
+            for i, statement in run:
+                print(f"\n--- Executing Statement {i}/{len(statements)} ---")
+                print(statement)
 
-        for i, statement in enumerate(statements):
-            print(f"\n--- Executing Statement {i+1}/{len(statements)} ---")
-            print(statement)
-            
             try:
-                # Clean the statement by removing any leading comments to properly
-                # identify its type (e.g., SELECT vs. SET).
-                cleaned_statement = '\n'.join(
-                    line for line in statement.strip().split('\n') 
-                    if not line.strip().startswith('--')
-                ).strip()
-
-                # Check if the cleaned statement is a SELECT query to fetch results
-                if cleaned_statement.upper().startswith('SELECT'):
-                    # For validation scripts, always force a refresh and provide a unique query name
-                    query_name = f"validation_{os.path.basename(filepath)}_{i}"
-                    df = sf.query_to_dataframe(statement, query_name=query_name, force_refresh=True, skip_cache_save=True)
-                    if df is not None:
-                        print("Query Result:")
-                        # Use to_string() to ensure the full DataFrame is printed
-                        print(df.to_string())
-                        final_df = df  # Store the dataframe
-                    else:
-                        print("Query executed but returned no data.")
-                # For other statements (SET, CREATE, etc.), just execute
+                if run_is_select:
+                    stream_to = output_path if run[-1][0] == last_select else None
+                    results = run_selects_async(sf, [statement for _, statement in run], output_path=stream_to)
+                    for (i, _), result in zip(run, results):
+                        print(f"\n--- Query Result of Statement {i}/{len(statements)} ---")
+                        if i == last_select and stream_to and result == 0:
+                            print(f"--- Query returned no rows; nothing was written to '{output_path}' ---")
+                        elif i == last_select and stream_to:
+                            print(f"--- Streamed {result} rows to '{output_path}' ---")
+                        else:
+                            # Use to_string() to ensure the full DataFrame is printed
+                            print(result.to_string())
                 else:
-                    sf.execute_query(statement)
-                    print("Statement executed successfully.")
+                    sf.connection.execute_string(';\n'.join(statement for _, statement in run), return_cursors=False)
+                    print("Statements executed successfully.")
             except Exception as e:
                 print(f"An error occurred while executing statement: {e}")
                 print("Aborting due to error.")
                 break
         
-        # 5. Save the final DataFrame to CSV if output_path is provided
-        if final_df is not None and output_path:
-            try:
-                # Create directory if it doesn't exist
-                output_dir = os.path.dirname(output_path)
-                if output_dir:
-                    os.makedirs(output_dir, exist_ok=True)
-                
-                final_df.to_csv(output_path, index=False)
-                print(f"\n--- Successfully saved query result to '{output_path}' ---")
-            except Exception as e:
-                print(f"\n--- Error saving result to CSV: {e} ---")
-
         print("\n--- Script execution finished ---")
 
 def main():
@@ -104,7 +203,7 @@ def main():
     """
     parser = argparse.ArgumentParser(description="Run a SQL script against Snowflake.")
     parser.add_argument("--script_path", required=True, help="The path to the .sql script to execute.")
-    parser.add_argument("--output_path", required=False, help="The path to save the final query result as a CSV.")
+    parser.add_argument("--output_path", required=False, help="The path to save the final query result to (.parquet or .csv).")
     
     args = parser.parse_args()
     
@@ -0,0 +1,75 @@
+"""
+SQL Statement Splitter
+
+Splits a SQL script into its individual statements in a single left-to-right pass.
+Unlike a plain `split(';')`, semicolons inside string literals, quoted identifiers,
+`$$ ... $$` blocks and comments do not end a statement, and comments are dropped
+in the same pass so callers no longer need separate regex clean-up passes.
+"""
+import re
+
+# Anything that can change the scanner state: a statement terminator, the start of
+# a comment, or the opening of a literal/quoted identifier/dollar-quoted block.
+_TOKEN_PATTERN = re.compile(r"--|/\*|\$\$|[;'\"]")
+
+# Each quoted region is consumed in one match. An unterminated region runs to the
+# end of the script, which is what Snowflake would report as the error position.
+_QUOTED_PATTERNS = {
+    "'": re.compile(r"'(?:[^'\\]|\\.|'')*'?", re.DOTALL),  # backslash or doubled-quote escapes
+    '"': re.compile(r'"(?:[^"]|"")*"?'),                    # doubled-quote escapes
+    '$$': re.compile(r"\$\$.*?(?:\$\$|\Z)", re.DOTALL),
+}
+
+
+def split_sql_statements(sql_script, strip_comments=True):
+    """
+    Splits a SQL script into statements on top-level semicolons.
+
+    Args:
+        sql_script (str): The full text of the SQL script.
+        strip_comments (bool): If True, `--` and `/* */` comments are removed
+                               from the returned statements.
+
+    Returns:
+        list[str]: The non-empty, whitespace-stripped statements in order.
+    """
+    statements = []
+    pieces = []  # Text of the statement being built, minus any stripped comments
+    start = 0    # Start of the text not yet copied into `pieces`
+    pos = 0
+    length = len(sql_script)
+
+    while True:
+        match = _TOKEN_PATTERN.search(sql_script, pos)
+        if match is None:
+            break
+        token, begin = match.group(), match.start()
+
+        if token == ';':
+            pieces.append(sql_script[start:begin])
+            statement = ''.join(pieces).strip()
+            if statement:
+                statements.append(statement)
+            pieces = []
+            start = pos = match.end()
+        elif token == '--' or token == '/*':
+            if token == '--':
+                end = sql_script.find('\n', begin)  # The newline itself is kept
+                end = length if end == -1 else end
+            else:
+                end = sql_script.find('*/', begin + 2)
+                end = length if end == -1 else end + 2
+            if strip_comments:
+                pieces.append(sql_script[start:begin])
+                if token == '/*':
+                    pieces.append(' ')  # Keep `SELECT/**/1` from becoming `SELECT1`
+                start = end
+            pos = end
+        else:
+            pos = _QUOTED_PATTERNS[token].match(sql_script, begin).end()
+
+    pieces.append(sql_script[start:])
+    statement = ''.join(pieces).strip()
+    if statement:
+        statements.append(statement)
+    return statements
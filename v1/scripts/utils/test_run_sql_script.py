@@ -0,0 +1,65 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+from run_sql_script import write_result_batches
+
+class FakeCursor:
+    """Stands in for a Snowflake cursor whose result arrives in the given Arrow batches."""
+
+    def __init__(self, batches):
+        self.batches = batches
+        self.fetch_kwargs = None
+
+    def fetch_arrow_batches(self, **kwargs):
+        self.fetch_kwargs = kwargs
+        return iter(self.batches)
+
+class WriteResultBatchesTest(unittest.TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.output_dir.cleanup)
+        # The integer column widens from int8 to int16 in the second batch
+        self.batches = [
+            pa.table({'ID': pa.array([1, 2], pa.int8()), 'NAME': ['a', 'b']}),
+            pa.table({'ID': pa.array([300], pa.int16()), 'NAME': ['c']}),
+        ]
+
+    def test_parquet_batches_with_different_schemas(self):
+        output_path = os.path.join(self.output_dir.name, 'result.parquet')
+        cursor = FakeCursor(self.batches)
+
+        self.assertEqual(write_result_batches(cursor, output_path), 3)
+        self.assertEqual(cursor.fetch_kwargs, {'force_microsecond_precision': True})
+        table = pq.read_table(output_path)
+        self.assertEqual(table.schema.field('ID').type, pa.int64())
+        self.assertEqual(table.column('ID').to_pylist(), [1, 2, 300])
+
+    def test_csv_batches_with_different_schemas(self):
+        output_path = os.path.join(self.output_dir.name, 'result.csv')
+
+        self.assertEqual(write_result_batches(FakeCursor(self.batches), output_path), 3)
+        self.assertEqual(pa_csv.read_csv(output_path).column('ID').to_pylist(), [1, 2, 300])
+
+    def test_empty_result_writes_nothing(self):
+        output_path = os.path.join(self.output_dir.name, 'result.parquet')
+
+        self.assertEqual(write_result_batches(FakeCursor([self.batches[0].slice(0, 0)]), output_path), 0)
+        self.assertFalse(os.path.exists(output_path))
+
+    def test_failed_export_removes_partial_file(self):
+        output_path = os.path.join(self.output_dir.name, 'result.parquet')
+        mismatched = pa.table({'OTHER': [1.5]})
+
+        with self.assertRaises(Exception):
+            write_result_batches(FakeCursor([self.batches[0], mismatched]), output_path)
+        self.assertFalse(os.path.exists(output_path))
+
+if __name__ == '__main__':
+    unittest.main()
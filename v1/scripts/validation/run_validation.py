@@ -1,9 +1,7 @@
 """
 Data Validation Runner
 
-This script exec            # We split by the single semicolon used as a delimiter.
-            sql_content = f.read()
-            queries = [q.strip() for q in sql_content.split(';') if q.strip()]s the validation queries defined in `data_validation.sql`
+This script executes the validation queries defined in `data_validation.sql`
 and prints the results of each check to the console. It is designed to be run
 as a standalone check to ensure data quality and integrity throughout the pipeline.
 
@@ -18,7 +16,6 @@ Key Features:
 """
 import os
 import sys
-import re
 from pathlib import Path
 import pandas as pd
 
@@ -26,8 +23,10 @@ import pandas as pd
 project_root = Path(__file__).resolve().parents[2]
 src_path = project_root / 'src'
 sys.path.append(str(src_path))
+sys.path.append(str(project_root / 'scripts' / 'utils'))
 
 from snowflake_connector import SnowflakeConnector
+from sql_splitter import split_sql_statements
 
 # Define the path to the validation SQL script.
 VALIDATION_SCRIPT_PATH = project_root / "scripts" / "validation" / "data_validation.sql"
@@ -46,12 +45,10 @@ def run_validation_checks():
         with open(VALIDATION_SCRIPT_PATH, 'r') as f:
             sql_content = f.read()
 
-        # Remove block comments (/* ... */) using regex
-        sql_content = re.sub(r'/\*.*?\*/', '', sql_content, flags=re.DOTALL)
-        
-        # Split the script into individual queries using semicolon as a delimiter
-        # and filter out any empty strings that result from the split.
-        queries = [q.strip() for q in sql_content.split(';') if q.strip()]
+        # Split the script into individual queries in one pass; comments are
+        # stripped and semicolons inside literals or comments are not treated
+        # as delimiters. Empty statements are skipped.
+        queries = split_sql_statements(sql_content)
 
         with SnowflakeConnector() as sf:
             if not sf.connection:
@@ -59,11 +56,6 @@ def run_validation_checks():
                 return
 
             for query in queries:
-                # Remove line comments (-- ...) from each individual query
-                query = re.sub(r'--.*', '', query).strip()
-                if not query:
-                    continue
-
                 print("\n" + "="*80)
                 # Extract the test name from the query for clear reporting
                 try: